@@ -4,10 +4,14 @@
 # purpose   Gets status-data from wlc and parses it to a json script
 #           which can be later visualized by a javascript
 
-import testcore.control.ssh
+import logging
 import os
 import sys
 import json
+import wlc_com
+
+# Show the errors of wlc_com (e.g. why it exits)
+logging.basicConfig(level=logging.WARNING)
 
 if len(sys.argv) < 3:
     print("Usage: python AutoWDSstatus.py <wlc-address> <wlc-username> <wlc_password>")
@@ -18,12 +22,6 @@ wlc_username = sys.argv[2]
 wlc_password = sys.argv[3]
 
 
-# Returns list of lists with tabledata from wlc for a given tablename, else empty table
-def get_table_data(tablename, hostname, username, password):
-    connection = testcore.control.ssh.SSH(host=hostname, username=username, password=password)
-    return connection.runquery_table(tablename)
-
-
 # Check if wlc is up
 def wlc_is_up(hostname):
     if not os.system("ping -c 1 " + hostname + " > /dev/null") == 0:
@@ -35,12 +33,15 @@ def wlc_is_up(hostname):
 if not wlc_is_up(wlc_address):
     exit(1)
 
-Active_Radios = get_table_data("/status/wlan-management/ap-status/active-radios", wlc_address, wlc_username, wlc_password)
-Accesspoints = get_table_data("/Status/WLAN-Management/AP-Configuration/Accesspoints/", wlc_address, wlc_username, wlc_password)
-Intra_Wlan_Discovery = get_table_data("/status/wlan-management/intra-wlan-discovery", wlc_address, wlc_username, wlc_password)
-Autowds_Profile = get_table_data("/status/wlan-management/ap-configuration/autowds-profile/", wlc_address, wlc_username, wlc_password)
-Autowds_topology = get_table_data("/status/wlan-management/ap-configuration/autowds-topology", wlc_address, wlc_username, wlc_password)
-Autowds_auto_topology = get_table_data("/status/wlan-management/ap-configuration/autowds-auto-topology", wlc_address, wlc_username, wlc_password)
+# Read all tables at the same time over the pooled sessions of wlc_com
+Active_Radios, Accesspoints, Intra_Wlan_Discovery, Autowds_Profile, Autowds_topology, Autowds_auto_topology = wlc_com.get_tables_data(
+    ["/status/wlan-management/ap-status/active-radios",
+     "/Status/WLAN-Management/AP-Configuration/Accesspoints/",
+     "/status/wlan-management/intra-wlan-discovery",
+     "/status/wlan-management/ap-configuration/autowds-profile/",
+     "/status/wlan-management/ap-configuration/autowds-topology",
+     "/status/wlan-management/ap-configuration/autowds-auto-topology"],
+    wlc_address, wlc_username, wlc_password)
 
 devices = set()
 modules = set()
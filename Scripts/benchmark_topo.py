@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# Purpose Headless benchmark of the tcca algorithms on generated topologies of growing size
+#
+# Every case runs in a fresh process, so the memory peaks of the cases do not influence each other.
+# Prints one JSON object per case (JSON lines), e.g.:
+#   ./benchmark_topo.py --aps 9 100 1000 --modules 2 --seeds 1 2 3 --output results.jsonl
+
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+import random
+import tcca
+import test_topo
+
+__author__ = 'kmanna'
+
+
+def get_peak_memory_kb():
+    """ Returns the peak resident memory of this process in kB so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes instead of kB
+        peak //= 1024
+    return peak
+
+
+def run_case(case):
+    """ Generates the topology of the case and times calculate_st, calculate_survival_links and calculate_ca on it
+
+    Keyword arguments:
+    case -- dict with "aps", "modules", "distance", "density", "seed", "channels", "refine" and "stats"
+    returns a dict with the case, the size of the topology, the seconds and memory peaks of each phase
+    """
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = dict(case)
+    if case["stats"]:
+        stats = tcca.PlanningStats()
+    else:
+        stats = None
+    result["start_peak_kb"] = get_peak_memory_kb()
+
+    graph = test_topo.create_topology(case["aps"], case["modules"], case["distance"], case["density"], case["seed"])
+    result["nodes"] = graph.number_of_nodes()
+    result["edges"] = graph.number_of_edges()
+    result["topology_peak_kb"] = get_peak_memory_kb()
+
+    # calculate_st selects its start device with the global random generator
+    random.seed(case["seed"])
+
+    start_time = time.time()
+    mst_graph = tcca.calculate_st(graph, stats=stats)
+    result["st_seconds"] = time.time() - start_time
+    result["st_peak_kb"] = get_peak_memory_kb()
+
+    start_time = time.time()
+    robust_graph = tcca.calculate_survival_links(mst_graph, graph, stats=stats)
+    result["survival_seconds"] = time.time() - start_time
+    result["survival_peak_kb"] = get_peak_memory_kb()
+
+    start_time = time.time()
+    tcca.calculate_ca(robust_graph, graph, case["channels"], stats=stats)
+    result["ca_seconds"] = time.time() - start_time
+    result["ca_peak_kb"] = get_peak_memory_kb()
+
+    if case["refine"]:
+        start_time = time.time()
+        tcca.refine_ca(robust_graph, graph, case["channels"], time_budget=case["refine"], stats=stats)
+        result["refine_seconds"] = time.time() - start_time
+
+    result["backup_links"] = robust_graph.number_of_edges() - mst_graph.number_of_edges()
+    if stats is not None:
+        result["stats"] = stats.to_dict()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark calculate_st, calculate_survival_links, calculate_ca and refine_ca on generated topologies")
+    parser.add_argument("--aps", type=int, nargs="+", default=[9, 25, 100, 400, 1000], help="numbers of APs of the topologies")
+    parser.add_argument("--modules", type=int, nargs="+", default=[2], help="numbers of modules (radios) per AP")
+    parser.add_argument("--distance", type=int, nargs="+", default=[1], help="grid distances up to which APs see each other")
+    parser.add_argument("--density", type=float, nargs="+", default=[1.0], help="probabilities that two modules in distance see each other")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1], help="seeds for the topologies")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 6, 11], help="allowed channels for calculate_ca")
+    parser.add_argument("--refine", type=float, default=0, help="seconds for the tabu search refinement of the channels (refine_ca), 0 skips it")
+    parser.add_argument("--stats", action="store_true", help="collect the tcca.PlanningStats of each case (slightly slower)")
+    parser.add_argument("--output", help="file to write the JSON lines to, default is stdout")
+    args = parser.parse_args()
+
+    cases = [{"aps": aps, "modules": modules, "distance": distance, "density": density, "seed": seed, "channels": args.channels, "refine": args.refine, "stats": args.stats}
+             for aps in args.aps
+             for modules in args.modules
+             for distance in args.distance
+             for density in args.density
+             for seed in args.seeds]
+
+    if args.output:
+        output = open(args.output, "w")
+    else:
+        output = sys.stdout
+
+    # One fresh process per case
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for result in pool.imap(run_case, cases):
+            output.write(json.dumps(result, sort_keys=True) + "\n")
+            output.flush()
+    finally:
+        pool.close()
+        pool.join()
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,225 @@
+import numpy as np
+import networkx as nx
+
+__author__ = 'kmanna'
+
+
+class CompiledTopology(object):
+    """ Integer indexed, read-only copy of a basic connectivity graph
+
+    The nodes (MACs) of the graph get dense integer ids in the order of graph.nodes().
+    The adjacency is stored in CSR form: the neighbors of node i are indices[indptr[i]:indptr[i + 1]] (sorted by id)
+    and slot_edge holds the edge id for each of those entries.
+    Edges get ids in the order of graph.edges(), with their endpoints in edge_u / edge_v and their snr in edge_snr.
+    Nodes carry is_module and module_of (id of the device a module belongs to, -1 for devices).
+
+    Keyword arguments:
+    graph -- undirected NetworkX graph where
+                edges may have the attribute "snr", edges without it get an snr of 0
+                nodes have the attribute "isModule" and modules may have the attribute "module-of"
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.names = graph.nodes()
+        self.index = dict((name, node) for node, name in enumerate(self.names))
+        self.node_count = len(self.names)
+
+        # Edges
+        edges = graph.edges()
+        self.edge_count = len(edges)
+        self.edge_u = np.array([self.index[a] for a, b in edges], dtype=np.int32)
+        self.edge_v = np.array([self.index[b] for a, b in edges], dtype=np.int32)
+        self.edge_snr = np.array([graph.edge[a][b].get("snr", 0) for a, b in edges], dtype=np.float64)
+
+        # Adjacency in CSR form, every edge shows up in the rows of both of its nodes
+        rows = np.concatenate((self.edge_u, self.edge_v))
+        columns = np.concatenate((self.edge_v, self.edge_u))
+        slot_edges = np.concatenate((np.arange(self.edge_count, dtype=np.int32), np.arange(self.edge_count, dtype=np.int32)))
+        order = np.lexsort((columns, rows))
+        self.indices = columns[order]
+        self.slot_edge = slot_edges[order]
+        self.indptr = np.zeros(self.node_count + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=self.node_count), out=self.indptr[1:])
+
+        # Node flags
+        self.is_module = np.array([bool(graph.node[name]["isModule"]) for name in self.names], dtype=bool)
+        self.edge_is_real = self.is_module[self.edge_u] & self.is_module[self.edge_v]
+        self.module_of = np.full(self.node_count, -1, dtype=np.int32)
+        for module in np.flatnonzero(self.is_module):
+            device = graph.node[self.names[module]].get("module-of")
+            if device in self.index:
+                self.module_of[module] = self.index[device]
+            else:
+                # Without the attribute the device is the one node the module has a fake edge to
+                for neighbor in self.neighbors(module):
+                    if not self.is_module[neighbor]:
+                        self.module_of[module] = neighbor
+                        break
+
+    def neighbors(self, node):
+        """ Returns the ids of the neighbors of node as list"""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def incident_edges(self, node):
+        """ Returns a list of (neighbor, edge id) tuples for the edges of node"""
+        start = self.indptr[node]
+        end = self.indptr[node + 1]
+        return zip(self.indices[start:end].tolist(), self.slot_edge[start:end].tolist())
+
+    def incident_edges_of_nodes(self, nodes):
+        """ Returns two numpy arrays with the neighbors and the edge ids of all edges of the given node ids (CSR rows of nodes)"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        degrees = self.indptr[nodes + 1] - self.indptr[nodes]
+        slots = np.repeat(self.indptr[nodes] - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+        return self.indices[slots], self.slot_edge[slots]
+
+    def is_connected(self):
+        """ Returns True if every node can be reached from node 0 (breadth-first over the CSR rows)"""
+        if self.node_count == 0:
+            return True
+        visited = np.zeros(self.node_count, dtype=bool)
+        visited[0] = True
+        layer = np.array([0], dtype=np.int64)
+        while len(layer) > 0:
+            neighbors, _ = self.incident_edges_of_nodes(layer)
+            layer = np.unique(neighbors[~visited[neighbors]])
+            visited[layer] = True
+        return bool(visited.all())
+
+    def edge_id(self, node_a, node_b):
+        """ Returns the id of the edge between node_a and node_b, raises KeyError if there is none"""
+        start = self.indptr[node_a]
+        end = self.indptr[node_a + 1]
+        slot = start + np.searchsorted(self.indices[start:end], node_b)
+        if slot == end or self.indices[slot] != node_b:
+            raise KeyError((self.names[node_a], self.names[node_b]))
+        return int(self.slot_edge[slot])
+
+    def ids_of_edges(self, graph):
+        """ Returns the (node_a, node_b, edge id) tuples for the edges of graph in the order of graph.edges()
+
+        graph has to be a subgraph of the compiled graph
+        """
+        index = self.index
+        return [(index[a], index[b], self.edge_id(index[a], index[b])) for a, b in graph.edges()]
+
+    def to_networkx(self, edges, node_graph=None):
+        """ Converts edges back to a NetworkX graph
+
+        The returned graph has all nodes of node_graph (default: the compiled graph) with a copy of their attributes
+        and the given edges with a copy of the attributes of the compiled graph.
+
+        Keyword arguments:
+        edges -- iterable of (node_a, node_b, edge id) tuples, the edges are added in this order and orientation
+        node_graph -- NetworkX graph to take the nodes and their attributes from
+        returns an undirected NetworkX graph
+        """
+        if node_graph is None:
+            node_graph = self.graph
+        graph = nx.Graph()
+        for node in node_graph.nodes():
+            graph.add_node(node)
+            for key in node_graph.node[node].keys():
+                graph.node[node][key] = node_graph.node[node][key]
+
+        names = self.names
+        for node_a, node_b, edge in edges:
+            name_a = names[node_a]
+            name_b = names[node_b]
+            graph.add_edge(name_a, name_b)
+            for key in self.graph.edge[name_a][name_b].keys():
+                graph.edge[name_a][name_b][key] = self.graph.edge[name_a][name_b][key]
+        return graph
+
+
+class TopologyView(object):
+    """ Copy-free subgraph of a CompiledTopology, given by edge ids
+
+    A view without parent holds its edges as mask over the edges of the (immutable) topology.
+    A derived view (derive) only stores the edges removed from and added to its parent,
+    so simulating failures or adding backups on a big graph allocates only the changes.
+    A view must not change any more once views got derived from it.
+
+    Keyword arguments:
+    topology -- CompiledTopology the edges belong to
+    edges -- iterable with the ids of the edges of the view, if it has no parent
+    parent -- TopologyView this view is derived from
+    """
+
+    def __init__(self, topology, edges=(), parent=None):
+        self.topology = topology
+        self.parent = parent
+        self.removed = set()
+        self.added = list()
+        self.added_set = set()
+        if parent is None:
+            self.base_edges = list(edges)
+            self.mask = np.zeros(topology.edge_count, dtype=bool)
+            self.mask[self.base_edges] = True
+            self.edge_count = int(self.mask.sum())
+        else:
+            self.edge_count = parent.edge_count
+
+    def derive(self):
+        """ Returns a new view on top of this one"""
+        return TopologyView(self.topology, parent=self)
+
+    def has_edge(self, edge):
+        """ Returns True if the edge id is in the view"""
+        if edge in self.removed:
+            return False
+        if edge in self.added_set:
+            return True
+        if self.parent is None:
+            return bool(self.mask[edge])
+        return self.parent.has_edge(edge)
+
+    def add_edge(self, edge):
+        """ Adds the edge id to the view"""
+        if self.has_edge(edge):
+            return
+        if edge in self.removed:
+            self.removed.discard(edge)
+        else:
+            self.added.append(edge)
+            self.added_set.add(edge)
+        self.edge_count += 1
+
+    def remove_edge(self, edge):
+        """ Removes the edge id from the view"""
+        if not self.has_edge(edge):
+            return
+        if edge in self.added_set:
+            self.added_set.discard(edge)
+            self.added.remove(edge)
+        else:
+            self.removed.add(edge)
+        self.edge_count -= 1
+
+    def edges(self):
+        """ Returns the ids of the edges of the view, the edges of the parent (or the given ones) first and then the added ones"""
+        if self.parent is None:
+            base_edges = self.base_edges
+        else:
+            base_edges = self.parent.edges()
+        return [edge for edge in base_edges if edge not in self.removed] + self.added
+
+    def neighbors(self, node):
+        """ Returns a list of (neighbor, edge id) tuples for the edges of node in the view"""
+        return [(neighbor, edge) for neighbor, edge in self.topology.incident_edges(node) if self.has_edge(edge)]
+
+    def adjacency(self):
+        """ Returns the view as list of dicts, which map each neighbor of a node to the id of the edge in between"""
+        adjacency = [dict() for node in xrange(self.topology.node_count)]
+        for edge in self.edges():
+            node_a = int(self.topology.edge_u[edge])
+            node_b = int(self.topology.edge_v[edge])
+            adjacency[node_a][node_b] = edge
+            adjacency[node_b][node_a] = edge
+        return adjacency
+
+    def to_networkx(self, node_graph=None):
+        """ Converts the view to a NetworkX graph like CompiledTopology.to_networkx"""
+        topology = self.topology
+        return topology.to_networkx([(int(topology.edge_u[edge]), int(topology.edge_v[edge]), edge) for edge in self.edges()], node_graph)
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# Purpose Structured trace of the decisions of the tcca planner and a replay tool for it
+#
+# The planner functions of tcca take an optional trace (PlannerTrace), without one they do not record anything.
+# Each event is one JSON object per line (NDJSON) with the event type in "e":
+#   st-start     -- calculate_st starts at the device "start"
+#   st-keep      -- calculate_st took over the edge "a" - "b" of a previous tree (warm start)
+#   st-edge      -- calculate_st added the edge "a" - "b" with "score"
+#   backup       -- calculate_survival_links protects the edge "a" - "b" with the backup "backup" ("score", "candidates")
+#   no-backup    -- calculate_survival_links found no backup for the edge "a" - "b"
+#   election     -- calculate_ca elected "channel" for the channel group "modules" with the "votes" ([channel, votes] pairs),
+#                   "tie" tells how a tie got resolved (None, "overall" or "random")
+#   refine       -- refine_ca moved the channel group "modules" from channel "old" to "channel"
+#   replan       -- replan got "changes" changes and plans "repaired" nodes again or everything ("full")
+#   multi-backup -- calculate_multi_failure_links added "backup" for the failure of "links" / "ap"
+# Replay:
+#   ./planner_trace.py autowds-trace.ndjson
+
+import json
+import sys
+
+__author__ = 'kmanna'
+
+
+class PlannerTrace(object):
+    """ Writes the events of the planner as NDJSON to a file object
+
+    Keyword arguments:
+    outfile -- file object opened for writing, e.g. open("autowds-trace.ndjson", "w")
+    """
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+
+    def emit(self, event, **fields):
+        """ Writes one event with the given fields"""
+        fields["e"] = event
+        self.outfile.write(json.dumps(fields, sort_keys=True, separators=(",", ":")))
+        self.outfile.write("\n")
+
+    def close(self):
+        self.outfile.close()
+
+
+def read_trace(filename):
+    """ Generates the events of a trace file as dicts"""
+    with open(filename) as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+def replay(events):
+    """ Reconstructs the decisions of the planner from the events of a trace
+
+    returns a dict with
+                "start" - the start device of the last calculate_st
+                "st" - list of the edges of the last calculate_st in the order they were added
+                "backups" - dict which maps each protected edge to its backup ("a b" keys, like the failover table)
+                "unprotected" - list of the edges without backup
+                "channels" - dict which maps each module to its last elected channel
+                "elections" - number of elections and "ties" the number of elections with a tie per kind
+                "multi_backups" - list of the multi failure backups as dicts with "links", "ap" and "backup"
+                "replans" - list of the replan markers as dicts with "changes", "full" and "repaired"
+    A replan drops the backups of the previous plan, since the survival links get calculated again,
+    but keeps the channels, because the channel groups which did not change are not elected again.
+    """
+    plan = {"start": None, "st": list(), "backups": dict(), "unprotected": list(), "channels": dict(), "elections": 0, "ties": dict(),
+            "multi_backups": list(), "replans": list()}
+    for event in events:
+        kind = event["e"]
+        if kind == "st-start":
+            plan["start"] = event["start"]
+            plan["st"] = list()
+        elif kind in ("st-keep", "st-edge"):
+            plan["st"].append([event["a"], event["b"]])
+        elif kind == "backup":
+            plan["backups"][" ".join(sorted((event["a"], event["b"])))] = event["backup"]
+        elif kind == "no-backup":
+            plan["unprotected"].append([event["a"], event["b"]])
+        elif kind == "election":
+            plan["elections"] += 1
+            if event["tie"] is not None:
+                plan["ties"][event["tie"]] = plan["ties"].get(event["tie"], 0) + 1
+            for module in event["modules"]:
+                plan["channels"][module] = event["channel"]
+        elif kind == "refine":
+            for module in event["modules"]:
+                plan["channels"][module] = event["channel"]
+        elif kind == "multi-backup":
+            plan["multi_backups"].append({"links": event["links"], "ap": event["ap"], "backup": event["backup"]})
+        elif kind == "replan":
+            plan["replans"].append({"changes": event["changes"], "full": event["full"], "repaired": event["repaired"]})
+            plan["backups"] = dict()
+            plan["unprotected"] = list()
+            plan["multi_backups"] = list()
+    return plan
+
+
+def print_events(events):
+    """ Prints the decision sequence of a trace in a readable form"""
+    for event in events:
+        kind = event["e"]
+        if kind == "st-start":
+            print("ST starts at " + str(event["start"]))
+        elif kind == "st-keep":
+            print("ST keeps " + str(event["a"]) + " - " + str(event["b"]))
+        elif kind == "st-edge":
+            print("ST adds " + str(event["a"]) + " - " + str(event["b"]) + " (score " + str(event["score"]) + ")")
+        elif kind == "backup":
+            print("Backup for " + str(event["a"]) + " - " + str(event["b"]) + ": " + " - ".join(event["backup"]) +
+                  " (score " + str(event["score"]) + " of " + str(event["candidates"]) + " candidates)")
+        elif kind == "no-backup":
+            print("No backup for " + str(event["a"]) + " - " + str(event["b"]))
+        elif kind == "election":
+            print("Channel " + str(event["channel"]) + " for " + str(len(event["modules"])) + " modules, votes " + str(event["votes"]) +
+                  ("" if event["tie"] is None else ", tie resolved by " + event["tie"]))
+        elif kind == "refine":
+            print("Refinement moves " + str(len(event["modules"])) + " modules from channel " + str(event["old"]) + " to " + str(event["channel"]))
+        elif kind == "replan":
+            print("Replanning for " + str(event["changes"]) + " changes: " + ("from scratch" if event["full"] else str(event["repaired"]) + " nodes again"))
+        elif kind == "multi-backup":
+            print("Backup for failure of " + str(event["links"]) + " " + str(event["ap"]) + ": " + " - ".join(event["backup"]))
+        else:
+            print(json.dumps(event, sort_keys=True))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: " + sys.argv[0] + " <trace.ndjson>")
+        exit(1)
+    print_events(read_trace(sys.argv[1]))
+    plan = replay(read_trace(sys.argv[1]))
+    print(str(len(plan["st"])) + " tree edges, " + str(len(plan["backups"])) + " backups, " + str(len(plan["unprotected"])) +
+          " unprotected edges, " + str(len(plan["multi_backups"])) + " multi failure backups, " + str(plan["elections"]) +
+          " elections with ties " + str(plan["ties"]) + ", " + str(len(plan["replans"])) + " replans")
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# Purpose Parameter sweep of the tcca pipeline (calculate_st, calculate_survival_links, calculate_ca) over archived basic graphs
+#
+# The basic graphs are archived with wlc_com.write_basic_graph. Directed graphs (as read from the WLC) get converted
+# with every given middle setting of convert_to_undirected_graph, undirected graphs are used as they are.
+# Every graph gets converted and compiled once before the worker processes start, the workers share them read-only.
+# Writes one CSV row with the plan metrics and timings per combination of graph, middle, channel list and seed, e.g.:
+#   ./sweep_topo.py site-a.gpickle site-b.gpickle --middle lower average --channels 1,6,11 36,40,44,48 --seeds 1 2 3
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import random
+import sys
+import time
+import compiled_topology
+import tcca
+import wlc_com
+
+__author__ = 'kmanna'
+
+columns = ["graph", "middle", "channels", "seed", "nodes", "edges", "tree_score", "backup_links", "channel_groups",
+           "co_channel_neighbors", "st_seconds", "survival_seconds", "ca_seconds"]
+
+# The converted graphs and their topologies of the worker processes, keyed by (filename, middle)
+sweep_graphs = None
+
+
+def prepare_graphs(filenames, middles):
+    """ Reads the archived graphs and converts and compiles each of them once per middle setting
+
+    Keyword arguments:
+    filenames -- list of files written by wlc_com.write_basic_graph
+    middles -- list of middle settings for wlc_com.convert_to_undirected_graph
+    returns a dict which maps (filename, middle) to (undirected graph, CompiledTopology), middle is None for undirected graphs
+    """
+    graphs = dict()
+    for filename in filenames:
+        basic_graph = wlc_com.read_basic_graph(filename)
+        if basic_graph.is_directed():
+            variants = [(middle, wlc_com.convert_to_undirected_graph(basic_graph, middle)) for middle in middles]
+        else:
+            variants = [(None, basic_graph)]
+        for middle, graph in variants:
+            # The graphs of the WLC only tell modules by their device ("module-of")
+            for node in graph.nodes():
+                if "isModule" not in graph.node[node]:
+                    graph.node[node]["isModule"] = "module-of" in graph.node[node]
+            graphs[(filename, middle)] = (graph, compiled_topology.CompiledTopology(graph))
+    return graphs
+
+
+def init_sweep_worker(graphs):
+    """ Hands the prepared graphs to a worker process, with fork they are shared and not copied"""
+    global sweep_graphs
+    sweep_graphs = graphs
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def count_co_channel_neighbors(topology, graph):
+    """ Returns the number of module pairs which see each other in the basic graph and use the same channel"""
+    names = topology.names
+    count = 0
+    for edge in topology.edge_is_real.nonzero()[0].tolist():
+        channel = graph.node[names[topology.edge_u[edge]]].get("channel")
+        if channel is not None and channel == graph.node[names[topology.edge_v[edge]]].get("channel"):
+            count += 1
+    return count
+
+
+def run_sweep_case(case):
+    """ Runs the pipeline for one combination
+
+    Keyword arguments:
+    case -- dict with "graph" (filename), "middle", "channels" (list) and "seed"
+    returns a dict with the case, the plan metrics and the seconds of each phase (see columns)
+    """
+    graph, topology = sweep_graphs[(case["graph"], case["middle"])]
+    result = dict(case)
+    result["channels"] = " ".join(str(channel) for channel in case["channels"])
+    result["nodes"] = topology.node_count
+    result["edges"] = topology.edge_count
+
+    # calculate_st selects its start device with the global random generator
+    random.seed(case["seed"])
+
+    start_time = time.time()
+    mst_graph = tcca.calculate_st(graph, topology=topology)
+    result["st_seconds"] = time.time() - start_time
+
+    start_time = time.time()
+    robust_graph = tcca.calculate_survival_links(mst_graph, graph, topology=topology)
+    result["survival_seconds"] = time.time() - start_time
+
+    start_time = time.time()
+    tcca.calculate_ca(robust_graph, graph, case["channels"], topology=topology)
+    result["ca_seconds"] = time.time() - start_time
+
+    result["tree_score"] = tcca.calculate_tree_score(topology, topology.ids_of_edges(mst_graph))
+    result["backup_links"] = robust_graph.number_of_edges() - mst_graph.number_of_edges()
+    result["channel_groups"] = len(tcca.get_channel_group_edges(topology, robust_graph)[1])
+    result["co_channel_neighbors"] = count_co_channel_neighbors(topology, robust_graph)
+    return result
+
+
+def parse_channel_list(channels):
+    """ Parses a comma separated channel list like "1,6,11" """
+    return [int(channel) for channel in channels.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run calculate_st, calculate_survival_links and calculate_ca for a parameter grid over archived basic graphs")
+    parser.add_argument("graphs", nargs="+", help="basic graphs archived with wlc_com.write_basic_graph")
+    parser.add_argument("--middle", nargs="+", default=["lower"], choices=["lower", "average", "upper"],
+                        help="settings of convert_to_undirected_graph for directed graphs")
+    parser.add_argument("--channels", type=parse_channel_list, nargs="+", default=[[1, 6, 11]], help="comma separated allowed channel lists")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1], help="seeds for the start device of calculate_st")
+    parser.add_argument("--processes", type=int, help="number of worker processes, default is the number of cpus")
+    parser.add_argument("--output", help="file to write the CSV table to, default is stdout")
+    args = parser.parse_args()
+
+    graphs = prepare_graphs(args.graphs, args.middle)
+    cases = [{"graph": filename, "middle": middle, "channels": channels, "seed": seed}
+             for filename, middle in sorted(graphs)
+             for channels in args.channels
+             for seed in args.seeds]
+
+    if args.output:
+        output = open(args.output, "wb")
+    else:
+        output = sys.stdout
+    writer = csv.DictWriter(output, columns, extrasaction="ignore")
+    writer.writeheader()
+
+    pool = multiprocessing.Pool(args.processes, init_sweep_worker, (graphs,))
+    try:
+        for result in pool.imap(run_sweep_case, cases):
+            writer.writerow(result)
+            output.flush()
+    finally:
+        pool.close()
+        pool.join()
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
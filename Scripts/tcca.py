@@ -1,14 +1,18 @@
 import logging
 import random
-import copy
+import heapq
+import bisect
+import numpy as np
 import networkx as nx
 import collections_enhanced
+import compiled_topology
 import json
+import time
+import multiprocessing
 
 __author__ = 'kmanna'
 
 edge_max_score = 1000  # The score for node-module connections, this has to be higher than any possible module-module connection
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger()
 
 
@@ -78,46 +82,245 @@ def write_json(graph, filename="autowds-graph.json"):
         json.dump(json_dict, outfile, indent=4)
 
 
-def module_is_used(mst_graphname, module):
-    """Check if module is used
+class EdgeFrontier(object):
+    """ Addressable priority queue of the candidate edges of calculate_st
 
-     Go through all neighbors, and if there is one neighbor, which is not reached over a real-connection, then this module is used
+    The edge with the highest score is returned first, if there is a tie the edge with the best snr wins.
+    Changing the score of an edge or removing an edge does not touch the heap, instead the old heap entry
+    gets marked as removed and is skipped once it reaches the top (lazy deletion).
+    So pushing, updating, removing and popping an edge all cost O(log E).
     """
-    for neighbor in mst_graphname.neighbors(module):
-        if is_real_edge(mst_graphname, module, neighbor):
-            return True
-    return False
 
+    def __init__(self):
+        self.heap = list()
+        self.entries = dict()
+        self.entry_counter = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, edge):
+        return edge in self.entries
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def push(self, edge, score, snr):
+        """ Add an edge to the frontier or change the score of an edge that is already in it"""
+        if edge in self.entries:
+            self.entries[edge][-1] = None
+
+        # The heapq module implements a min-heap, so store the negated values
+        # The entry_counter makes entries unique, so the edges themselves are never compared
+        entry = [-score, -snr, self.entry_counter, edge]
+        self.entry_counter += 1
+        self.entries[edge] = entry
+        heapq.heappush(self.heap, entry)
+
+        # Rebuild the heap if it is mostly made of removed entries
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[-1] is not None]
+            heapq.heapify(self.heap)
+
+    def remove(self, edge):
+        """ Remove an edge from the frontier"""
+        entry = self.entries.pop(edge)
+        entry[-1] = None
+
+    def pop(self):
+        """ Remove the best edge from the frontier and return it together with its score"""
+        while self.heap:
+            negative_score, negative_snr, count, edge = heapq.heappop(self.heap)
+            if edge is not None:
+                del self.entries[edge]
+                return edge, -negative_score
+        raise KeyError("pop from an empty edge frontier")
+
+
+class ChannelGroups(object):
+    """ Disjoint-set index of the channel groups of a growing graph on the node ids of a compiled topology
+
+    A channel group is a set of modules which are connected over module-module edges.
+    Every module which has not been added with an edge yet is a group on its own.
+    labels[module] holds the root of the group of module, or -1 as long as the module has no module-module edge.
+    For each group the root stores the number of module-module edges (edge_counts[root]) and the modules of the group (members[root]).
+    A union relabels the members of the smaller group (union by size), so a find is a single lookup
+    and the labels can be used directly as array by calculate_scores_for_compiled_edges.
+    Edges can only be added, since calculate_st only adds edges to its tree.
+    """
 
-def count_connected_module_edges_for_module(graph, module, wlan_modules):
-    """Count number of connected module-module edges
+    def __init__(self, node_count):
+        self.labels = np.full(node_count, -1, dtype=np.int32)
+        self.edge_counts = np.zeros(node_count, dtype=np.int32)
+        self.members = dict()
+
+    def find(self, module):
+        """ Returns the root module of the group of module"""
+        root = self.labels[module]
+        if root < 0:
+            return module
+        return root
+
+    def add_edge(self, module_a, module_b):
+        """ Add a module-module edge and merge the groups of its modules"""
+        for module in (module_a, module_b):
+            if self.labels[module] < 0:
+                self.labels[module] = module
+                self.members[module] = [module]
+
+        root_a = self.labels[module_a]
+        root_b = self.labels[module_b]
+        if root_a == root_b:
+            self.edge_counts[root_a] += 1
+            return
+
+        # Keep the root of the bigger group and relabel the members of the smaller one
+        if len(self.members[root_a]) < len(self.members[root_b]):
+            root_a, root_b = root_b, root_a
+        members_b = self.members.pop(root_b)
+        self.labels[members_b] = root_a
+        self.members[root_a].extend(members_b)
+        self.edge_counts[root_a] += self.edge_counts[root_b] + 1
+        self.edge_counts[root_b] = 0
+
+    def has_edges(self, module):
+        """ Returns True if module has a module-module edge, i.e. it is used"""
+        return self.labels[module] >= 0
+
+    def get_modules(self, module):
+        """ Returns the list of modules in the group of module (do not modify it)"""
+        return self.members.get(self.find(module), [module])
+
+    def same_group(self, module_a, module_b):
+        """ Returns True if both modules are in the same group"""
+        return self.find(module_a) == self.find(module_b)
+
+
+class PlanningContext(object):
+    """ Per-run cache of the module neighbourhoods of a compiled topology and of the graph we are building on it
+
+    Precomputed once:
+        modules / module_names -- frozensets with the ids / names of the modules
+        module_indptr / module_indices -- the module neighbors of each node id in the basic graph in CSR form (empty rows for devices)
+    Kept up to date for the graph we are building (working graph):
+        channel_groups -- ChannelGroups of the working graph
 
-    For a given module and a graph counts the module edges we can reach by stepping over only other module edges.
+    Keyword arguments:
+    topology -- CompiledTopology of the basic connectivity graph
+    """
 
-    Returns number of modules as integer
+    def __init__(self, topology):
+        self.topology = topology
+        is_module = topology.is_module
+        module_ids = np.flatnonzero(is_module)
+        self.modules = frozenset(module_ids.tolist())
+        self.module_names = frozenset(topology.names[module] for module in module_ids)
+
+        # Module neighbors: the CSR rows of the topology without the devices
+        module_slots = is_module[topology.indices]
+        row_of_slot = np.repeat(np.arange(topology.node_count), np.diff(topology.indptr))
+        module_slots &= topology.indices != row_of_slot
+        self.module_indices = topology.indices[module_slots]
+        self.module_indptr = np.zeros(topology.node_count + 1, dtype=np.int32)
+        np.cumsum(np.bincount(row_of_slot[module_slots], minlength=topology.node_count), out=self.module_indptr[1:])
+
+        self.channel_groups = ChannelGroups(topology.node_count)
+        self.split = None
+
+    def add_edge(self, node_a, node_b):
+        """ Tell the context that the working graph gained the edge between node_a and node_b"""
+        if node_a not in self.modules or node_b not in self.modules:
+            # Fake edges do not change any channel group
+            return
+        self.channel_groups.add_edge(node_a, node_b)
+
+    def set_working_graph(self, adjacency):
+        """ Replace the working graph by the graph given by its adjacency (list of dicts / sets of neighbor ids)
+
+        Needed if the working graph lost edges, the channel groups get rebuilt
+        """
+        self.channel_groups = get_compiled_channel_groups(self.topology, adjacency)
+        self.split = None
+
+    def split_channel_group(self, root, positions, low, high, inside_edge_count):
+        """ Let the batch scoring see the channel group of root as split in two, without changing the channel groups
+
+        This is how the channel groups look like if a bridge of the group fails.
+        The modules of the group with low <= positions[module] < high form a group of their own with inside_edge_count edges,
+        the other modules keep the group of root with the remaining edges (without the failed one).
+        join_channel_group undoes the split.
+
+        Keyword arguments:
+        root -- root module of the channel group which gets split
+        positions -- numpy array with a position for each node id
+        low, high -- range of positions of the modules in the split off part
+        inside_edge_count -- number of module-module edges of the split off part
+        """
+        outside_edge_count = self.channel_groups.edge_counts[root] - 1 - inside_edge_count
+        self.split = (root, positions, low, high, inside_edge_count, outside_edge_count)
+
+    def join_channel_group(self):
+        """ Undoes split_channel_group"""
+        self.split = None
+
+    def get_labels(self, nodes):
+        """ Returns the channel group labels (see ChannelGroups) of a numpy array of node ids for the batch scoring
+
+        A part split off by split_channel_group gets the label node_count
+        """
+        labels = self.channel_groups.labels[nodes]
+        if self.split is not None:
+            root, positions, low, high, inside_edge_count, outside_edge_count = self.split
+            node_positions = positions[nodes]
+            labels = np.where((labels == root) & (node_positions >= low) & (node_positions < high), self.topology.node_count, labels)
+        return labels
+
+    def count_group_edges(self, labels):
+        """ Returns the number of module-module edges of the channel groups with the given labels (from get_labels)"""
+        edge_counts = self.channel_groups.edge_counts
+        if self.split is None:
+            return np.where(labels >= 0, edge_counts[labels], 0)
+        root, positions, low, high, inside_edge_count, outside_edge_count = self.split
+        counts = np.where((labels >= 0) & (labels < self.topology.node_count), edge_counts[np.clip(labels, 0, self.topology.node_count - 1)], 0)
+        counts[labels == root] = outside_edge_count
+        counts[labels == self.topology.node_count] = inside_edge_count
+        return counts
+
+
+class PlanningStats(object):
+    """ Optional counters of the planning algorithms, pass an instance as stats to calculate_st, calculate_survival_links and calculate_ca
+
+    The algorithms only count if they get a stats object, so there is no cost without one.
+    counters -- collections_enhanced.Counter with
+                    "score-evaluations" - number of edges scored
+                    "bfs-node-visits" - number of nodes reached by the breadth-first searches
+                    "survival-path-checks" - number of checks if a failed edge still has a path between its nodes
+                    "channel-elections" - number of channel groups a channel got elected for
+                    "rescored" / "rescoring-skipped" - number of frontier edges rescored / not rescored after a new edge
+    frontier_sizes -- list with the size of the frontier of calculate_st in each step
+    phase_seconds -- collections_enhanced.Counter with the wall time of each algorithm ("st", "survival", "ca")
     """
-    connection_counter = 0
-    edges_done = set()
-    modules_todo = list()
 
-    # Start with initial module node
-    modules_todo.append(module)
+    def __init__(self):
+        self.counters = collections_enhanced.Counter()
+        self.frontier_sizes = list()
+        self.phase_seconds = collections_enhanced.Counter()
 
-    for mod in modules_todo:
-        for neighbor in graph.neighbors(mod):
-            if neighbor in wlan_modules:
-                if (mod, neighbor) not in edges_done:
-                    # Increase connection counter
-                    connection_counter += 1
+    def to_dict(self):
+        """ Returns the stats as dict which can be dumped as json"""
+        return {"counters": dict(self.counters), "frontier_sizes": self.frontier_sizes, "phase_seconds": dict(self.phase_seconds)}
 
-                    # Add edge to done-list
-                    edges_done.add((mod, neighbor))
-                    edges_done.add((neighbor, mod))
+    def write_json(self, filename="tcca-stats.json"):
+        """ Writes the stats to a json file"""
+        with open(filename, "w") as outfile:
+            json.dump(self.to_dict(), outfile, sort_keys=True)
 
-                    # Add module to go if not already visited
-                    if neighbor not in modules_todo:
-                        modules_todo.append(neighbor)
-    return connection_counter
+    def __str__(self):
+        lines = ["Phase " + phase + ": " + str(self.phase_seconds[phase]) + "s" for phase in sorted(self.phase_seconds)]
+        lines += [counter + ": " + str(self.counters[counter]) for counter in sorted(self.counters)]
+        if self.frontier_sizes:
+            lines.append("frontier-size: max " + str(max(self.frontier_sizes)) + " over " + str(len(self.frontier_sizes)) + " steps")
+        return "\n".join(lines)
 
 
 def translate_snr_to_bw(snr_lancom_value):
@@ -141,111 +344,233 @@ def translate_snr_to_bw(snr_lancom_value):
         return 56
 
 
-def get_used_module_neighbors(graph, basic_con_graph, node, wlan_modules):
-    """ Get a list of active module neighbors for a node
-    Returns a list with modules
-    """
-    module_neighbors = list()
-    for neighbor in basic_con_graph.neighbors(node):
-        if neighbor in wlan_modules and neighbor is not node:
-            module_neighbors.append(neighbor)
-    # Return all neighbors of node in basic_con_graph which are actually used in graph
-    return [i for i in module_neighbors if module_is_used(graph, i)]
-
-
-def get_connected_modules_for_module(graph, module, wlan_modules):
-    """ Get modules which are connected to this module
-
-    For a given module return the modules connected to this module over a module-module edge in graph
+def translate_snrs_to_bw(snr_lancom_values):
+    """Translate an array of signal to noise ratios to expected bandwidths
 
-    Returns a list with modules
+    Vectorized version of translate_snr_to_bw (but gives the value above the curve as float)
+    Returns a numpy array with the indicators for the expected bandwidth, higher is better
     """
-    connected_modules = list()
-    edges_done = set()
-    modules_todo = list()
-
-    # Add initial node to be able to start from there
-    modules_todo.append(module)
+    signal_to_noise = np.asarray(snr_lancom_values, dtype=np.float64) / 100.0 * 46.0
+    return np.select([signal_to_noise <= 0,
+                      signal_to_noise <= 10,
+                      signal_to_noise <= 20,
+                      signal_to_noise <= 25,
+                      signal_to_noise <= 30],
+                     [0,
+                      signal_to_noise,
+                      2 * signal_to_noise - 10,
+                      3 * signal_to_noise - 30,
+                      2 * signal_to_noise - 5],
+                     56)
 
-    for mod in modules_todo:
-        for neighbor in graph.neighbors(mod):
-            if neighbor in wlan_modules and (mod, neighbor) not in edges_done:
-                connected_modules.append(neighbor)
 
-                # Add edge to done-list
-                edges_done.add((mod, neighbor))
-                edges_done.add((neighbor, mod))
-
-                # Add module to go if not already visited
-                if neighbor not in modules_todo:
-                    modules_todo.append(neighbor)
-    return connected_modules
+def get_modules_of_graph(graphname):
+    """ For a given graph return a frozenset of nodes where the "isModule" flag is true
+    """
 
+    return frozenset(node for (node, attributes) in graphname.nodes(data=True) if attributes["isModule"])
 
-def get_used_interference_modules_for_link(graph, basic_con_graph, node_a, node_b, wlan_modules):
-    """ Get a list of module neighbors for two nodes in a given graph, which are in the interference range of the two nodes
 
-    Returns a list of modules which are in interference range
-    """
-    possibly_interfering_modules = list(set(get_used_module_neighbors(graph, basic_con_graph, node_a, wlan_modules) + get_used_module_neighbors(graph, basic_con_graph, node_b, wlan_modules)))
-    # Remove our own modules (because the modules see each other)
-    for module in [node_a, node_b]:
-        if module in possibly_interfering_modules:
-            possibly_interfering_modules.remove(module)
-    # Take only those modules from this list, which actually interfere,
-    # that means: only modules which use the same channel,
-    # that means: those are connected(ie. those modules i can reach from a module using only module-module edges)
-    actually_interfering_modules = get_connected_modules_for_module(graph, node_a, wlan_modules) + get_connected_modules_for_module(graph, node_b, wlan_modules)
-    return [i for i in possibly_interfering_modules if i in actually_interfering_modules]
-
-
-def calculate_score_for_edge(curr_mst_graph, basic_con_graph, node_a, node_b, wlan_modules):
-    """ Calculate Edgescore for a given edge
+def calculate_scores_for_compiled_edges(context, nodes_a, nodes_b, edges):
+    """ Calculate the Edgescores for a batch of edges of a compiled topology in one numpy pass
     A higher score is better
 
     Keyword arguments:
-    curr_mst_graph -- The MST NetworkX graph we created so far
-    basic_con_graph -- The underlying networkX topology graph
-                        This graphs read-edges have to have the attribute "snr"
-    node_a -- name of the node of basic_con_graph for which we want to calculate the score
-    node_b -- name of the node of basic_con_graph for which we want to calculate the score
-    wlan_modules -- List with the names of modules of basic_con_graph
-    returns score as float
+    context -- PlanningContext of the underlying connectivity graph and the graph we created so far
+    nodes_a -- sequence with the ids of the first nodes of the edges
+    nodes_b -- sequence with the ids of the second nodes of the edges
+    edges -- sequence with the ids of the edges
+    returns a numpy array with the scores as float
     """
 
-    if is_fake_edge(basic_con_graph, node_a, node_b):
-        return edge_max_score
+    topology = context.topology
+
+    nodes_a = np.asarray(nodes_a, dtype=np.int64)
+    nodes_b = np.asarray(nodes_b, dtype=np.int64)
+    edges = np.asarray(edges, dtype=np.int64)
+    is_module = topology.is_module
+    labels_a = context.get_labels(nodes_a)
+    labels_b = context.get_labels(nodes_b)
+
+    # Number of module-module edges of the channel groups of both nodes
+    sum_connected_count = context.count_group_edges(labels_a) + context.count_group_edges(labels_b)
 
-    node_a_connected_count = count_connected_module_edges_for_module(curr_mst_graph, node_a, wlan_modules)
-    node_b_connected_count = count_connected_module_edges_for_module(curr_mst_graph, node_b, wlan_modules)
-    sum_connected_count = node_a_connected_count + node_b_connected_count
+    expected_bandwidth = translate_snrs_to_bw(topology.edge_snr[edges])
 
-    average_snr = basic_con_graph.edge[node_a][node_b]["snr"]
-    expected_bandwidth = translate_snr_to_bw(average_snr)
+    # Gather all (edge, module neighbor) pairs of the module neighbors of both nodes from the CSR arrays
+    endpoints = np.concatenate((nodes_a, nodes_b))
+    owners = np.tile(np.arange(len(edges)), 2)
+    degrees = context.module_indptr[endpoints + 1] - context.module_indptr[endpoints]
+    slots = np.repeat(context.module_indptr[endpoints] - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+    neighbors = context.module_indices[slots]
+    owners = np.repeat(owners, degrees)
 
-    interfering_modules = get_used_interference_modules_for_link(curr_mst_graph, basic_con_graph, node_a, node_b, wlan_modules)
-    nr_interfering_modules = len(interfering_modules)
+    # Only used modules of the channel groups of node_a and node_b interfere (but not our own modules)
+    neighbor_labels = context.get_labels(neighbors)
+    interfering = ((neighbor_labels >= 0) &
+                   ((neighbor_labels == labels_a[owners]) | (neighbor_labels == labels_b[owners])) &
+                   (neighbors != nodes_a[owners]) & (neighbors != nodes_b[owners]))
+
+    # A module which neighbors both nodes counts only once
+    interfering_pairs = np.unique(owners[interfering] * topology.node_count + neighbors[interfering])
+    nr_interfering_modules = np.bincount(interfering_pairs // topology.node_count, minlength=len(edges))
 
     # Circumvent the division by zero case
-    if nr_interfering_modules == 0:
-        nr_interfering_modules = 1
-    if sum_connected_count == 0:
-        sum_connected_count = 1
+    nr_interfering_modules = np.maximum(nr_interfering_modules, 1)
+    sum_connected_count = np.maximum(sum_connected_count, 1)
 
     # Divide expected bandwidth by the number of interfering channels, since we share the channel with those links
-    score = expected_bandwidth / (sum_connected_count * nr_interfering_modules)
+    # translate_snr_to_bw returns the integer 56 above its curve, so the score is an integer division there
+    divisor = sum_connected_count * nr_interfering_modules
+    scores = expected_bandwidth / divisor
+    above_curve = ~(topology.edge_snr[edges] / 100.0 * 46.0 <= 30)
+    scores[above_curve] = 56 // divisor[above_curve]
 
-    return score
+    # Node-module connections always get the highest score
+    scores[~(is_module[nodes_a] & is_module[nodes_b])] = edge_max_score
 
+    return scores
 
-def get_modules_of_graph(graphname):
-    """ For a given graph return a list of nodes where the "isModule" flag is true
-    """
 
-    return [node for (node, attributes) in graphname.nodes(data=True) if attributes["isModule"]]
+def get_compiled_channel_groups(topology, adjacency):
+    """ Returns the ChannelGroups of a graph given by its adjacency (list of dicts / sets of neighbor ids)"""
+    is_module = topology.is_module.tolist()
+    channel_groups = ChannelGroups(topology.node_count)
+    labels = [-1] * topology.node_count
 
+    # Walk each channel group once over the module-module edges, its first module becomes the root
+    for root in np.flatnonzero(topology.is_module).tolist():
+        if labels[root] >= 0:
+            continue
+        members = [root]
+        labels[root] = root
+        nr_edge_ends = 0
+        for module in members:
+            for neighbor in adjacency[module]:
+                if is_module[neighbor]:
+                    nr_edge_ends += 1
+                    if labels[neighbor] < 0:
+                        labels[neighbor] = root
+                        members.append(neighbor)
+        if nr_edge_ends == 0:
+            # Modules without module-module edges are not in a group
+            labels[root] = -1
+        else:
+            channel_groups.members[root] = members
+            channel_groups.edge_counts[root] = nr_edge_ends // 2
+    channel_groups.labels[:] = labels
+    return channel_groups
+
+
+class SpanningTreeCover(object):
+    """ Rooted spanning tree of a graph, which keeps track of the tree edges that are protected by other edges
+
+    The tree gets built by one depth-first search from root over the graph given by its adjacency
+    (list of dicts, which map each neighbor of a node to the id of the edge in between).
+    parent[node] / parent_edge[node] hold the parent of node and the id of the edge in between (-1 for the root),
+    depth[node] its depth and order the nodes in the order of the search.
+    tin[node] <= tin[other] < tout[node] holds exactly for the nodes other in the subtree of node.
+    A tree edge is covered (no bridge) if an edge, which is not in the tree, connects its subtree with the rest.
+    cover_path marks the tree edges on the path between the nodes of such an edge. Covered paths get skipped
+    with a union-find over the nodes (up), so covering all paths together takes near-linear time.
+    The nodes in the order of the search (order_array) together with tin_array are the index get_crossing_edges
+    uses to find the edges across the cut of a tree edge.
+    """
 
-def calculate_st(graphname):
+    def __init__(self, adjacency, root):
+        node_count = len(adjacency)
+        self.parent = [-1] * node_count
+        self.parent_edge = [-1] * node_count
+        self.depth = [0] * node_count
+        self.tin = [-1] * node_count
+        self.tout = [-1] * node_count
+        self.order = list()
+        self.covered = [False] * node_count
+        self.up = range(node_count)
+
+        # Iterative depth-first search, the stack holds (node, iterator over its neighbors)
+        self.tin[root] = 0
+        self.order.append(root)
+        stack = [(root, iter(adjacency[root]))]
+        while stack:
+            node, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if self.tin[neighbor] < 0:
+                    self.parent[neighbor] = node
+                    self.parent_edge[neighbor] = adjacency[node][neighbor]
+                    self.depth[neighbor] = self.depth[node] + 1
+                    self.tin[neighbor] = len(self.order)
+                    self.order.append(neighbor)
+                    stack.append((neighbor, iter(adjacency[neighbor])))
+                    break
+            else:
+                stack.pop()
+                self.tout[node] = len(self.order)
+
+        # Index for get_crossing_edges
+        self.order_array = np.array(self.order, dtype=np.int64)
+        self.tin_array = np.array(self.tin, dtype=np.int64)
+
+    def get_crossing_edges(self, topology, node, excluded_edge=None):
+        """ Returns the sorted ids of the edges of topology which connect the subtree of node with the rest of the graph
+
+        Only the edges of the smaller side get looked at, so this takes time proportional to the edges of that side
+        and not to all edges of the graph.
+
+        Keyword arguments:
+        topology -- CompiledTopology the tree was built on
+        node -- id of the node whose subtree is the one side of the cut
+        excluded_edge -- optional id of an edge which is left out (the failed edge itself)
+        returns a list of edge ids
+        """
+        low = self.tin[node]
+        high = self.tout[node]
+        side_is_subtree = 2 * (high - low) <= len(self.order)
+        if side_is_subtree:
+            side = self.order_array[low:high]
+        else:
+            side = np.concatenate((self.order_array[:low], self.order_array[high:]))
+
+        # An edge of the side crosses the cut if its other node is on the other side
+        neighbors, edges = topology.incident_edges_of_nodes(side)
+        neighbor_tin = self.tin_array[neighbors]
+        neighbor_in_subtree = (neighbor_tin >= low) & (neighbor_tin < high)
+        if side_is_subtree:
+            edges = edges[~neighbor_in_subtree]
+        else:
+            edges = edges[neighbor_in_subtree]
+        edges = np.unique(edges)
+        if excluded_edge is not None:
+            edges = edges[edges != excluded_edge]
+        return edges.tolist()
+
+    def find_uncovered(self, node):
+        """ Returns the first ancestor of node (or node itself) whose edge to its parent is not covered"""
+        path = list()
+        while self.up[node] != node:
+            path.append(node)
+            node = self.up[node]
+        for visited_node in path:
+            self.up[visited_node] = node
+        return node
+
+    def cover_path(self, node_a, node_b):
+        """ Marks all tree edges on the path between node_a and node_b as covered"""
+        node_a = self.find_uncovered(node_a)
+        node_b = self.find_uncovered(node_b)
+        while node_a != node_b:
+            if self.depth[node_a] < self.depth[node_b]:
+                node_a, node_b = node_b, node_a
+            self.covered[node_a] = True
+            self.up[node_a] = self.parent[node_a]
+            node_a = self.find_uncovered(node_a)
+
+    def is_covered(self, node):
+        """ Returns True if the edge between node and its parent is covered"""
+        return self.covered[node]
+
+
+def calculate_st(graphname, topology=None, start_node=None, stats=None, trace=None, initial_tree=None):
     """ Find the maximal spanning tree
 
     Keyword arguments:
@@ -254,268 +579,798 @@ def calculate_st(graphname):
                         "snr" - Integer which indicates the Signal to Noise ratio for this edge.
                     nodes have attributes
                         "isModule" - True if node is a Module or False if not
+    topology -- optional CompiledTopology of graphname, it gets compiled if it is not given
+    start_node -- optional device to start the tree from, a random device is selected if it is not given
+    stats -- optional PlanningStats which gets the counters and the wall time of this run added
+    trace -- optional planner_trace.PlannerTrace which gets the start and each added edge
+    initial_tree -- optional list of (name_a, name_b) edges of graphname, a connected part of a previous tree which contains
+                    start_node, the tree is grown from it instead of from start_node alone (warm start, see replan)
     returns an undirected MST NetworkX Graph
     """
 
     logger.info("Calculating MST on Graph...")
+    if stats is not None:
+        start_time = time.time()
 
-    wlan_modules = get_modules_of_graph(graphname)
-
-    mst = nx.Graph()
-    visited_nodes = set()
-    edge_list = collections_enhanced.Counter()  # Edge list contains triple with (source,target,edge-weigth)
-    all_nodes = set()
-
-    # Copy nodes from graphname to mst and fill the set: all_nodes
-    for node in graphname.nodes():
-        all_nodes.add(node)
-        mst.add_node(node)
-        for key in graphname.node[node].keys():
-            mst.node[node][key] = graphname.node[node][key]
+    # The tree is built on the node ids of the compiled topology and only converted back to NetworkX in the end
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(graphname)
+    is_module = topology.is_module.tolist()
+    edge_snr = topology.edge_snr
 
-    # Devices are all those nodes which are not modules
-    not_wlan_modules = [node for node in graphname.nodes() if node not in wlan_modules]
+    mst_edges = list()
+    visited_nodes = [False] * topology.node_count
+    nr_visited_nodes = 0
 
     # Select random Device to start with
-    start_node = random.choice(list(not_wlan_modules))
-
-    # Add the edges originating from start node to edge_list
-    visited_nodes.add(start_node)
-    for neighbor in graphname.neighbors(start_node):
-        edge_list[(start_node, neighbor)] = calculate_score_for_edge(mst, graphname, start_node, neighbor, wlan_modules)
+    if start_node is None:
+        start_node = random.choice(get_devices_of_compiled_topology(topology))
+    start_node = topology.index[start_node]
+    if trace is not None:
+        trace.emit("st-start", start=topology.names[start_node])
+
+    # The frontier holds the productive edges as (source, target, edge id) (source visited, target not yet visited)
+    # frontier_edges_to holds for each not yet visited node the frontier edges which lead to it
+    # frontier_edges_at holds for each module the real frontier edges which touch it
+    frontier = EdgeFrontier()
+    frontier_edges_to = dict()
+    frontier_edges_at = dict()
+    context = PlanningContext(topology)
+    rescored = 0
+    rescoring_skipped = 0
+
+    # Add the edges originating from start node to the frontier
+    visited_nodes[start_node] = True
+    nr_visited_nodes += 1
+    if initial_tree is None:
+        new_edges = [(start_node, neighbor, edge) for neighbor, edge in topology.incident_edges(start_node)]
+    else:
+        # Take over the given part of the tree, the frontier are the edges from it to all nodes which are not in it yet
+        for name_a, name_b in initial_tree:
+            node_a = topology.index[name_a]
+            node_b = topology.index[name_b]
+            for node in (node_a, node_b):
+                if not visited_nodes[node]:
+                    visited_nodes[node] = True
+                    nr_visited_nodes += 1
+            mst_edges.append((node_a, node_b, topology.edge_id(node_a, node_b)))
+            context.add_edge(node_a, node_b)
+            if trace is not None:
+                trace.emit("st-keep", a=name_a, b=name_b)
+        new_edges = [(neighbor, node, edge) for node in xrange(topology.node_count) if not visited_nodes[node]
+                     for neighbor, edge in topology.incident_edges(node) if visited_nodes[neighbor]]
+    new_scores = calculate_scores_for_compiled_edges(context, [a for a, b, edge in new_edges], [b for a, b, edge in new_edges], [edge for a, b, edge in new_edges])
+    for (a, b, edge), score in zip(new_edges, new_scores.tolist()):
+        frontier.push((a, b, edge), score, edge_snr[edge])
+        frontier_edges_to.setdefault(b, list()).append((a, b, edge))
+        if is_module[a] and is_module[b]:
+            frontier_edges_at.setdefault(a, set()).add((a, b, edge))
+            frontier_edges_at.setdefault(b, set()).add((a, b, edge))
+    scored = len(new_edges)
 
     # Main loop
-    while True:
-        # Remove all edges which do not see new nodes (keep only productive edges)
-        removed_edge = True
-        while removed_edge:
-            removed_edge = False
-            for (a, b) in edge_list:
-                if a in visited_nodes and b in visited_nodes:
-                    removed_edge = True
-                    del edge_list[(a, b)]
-                    break
+    while nr_visited_nodes != topology.node_count:
 
-        # If the edge_list is empty after removing unproductive edges, check if we visited all nodes
-        if len(edge_list) == 0:
-            if len(visited_nodes) != graphname.number_of_nodes():
-                logger.error("Could not connect all nodes.")
-                logger.error("Graph / APs are separated, maybe wait some time until they can at least theoretically span a network.")
-                exit(1)
-            else:
-                break
+        # If the frontier is empty, but we did not visit all nodes yet, then we cannot reach them
+        if len(frontier) == 0:
+            logger.error("Could not connect all nodes.")
+            logger.error("Graph / APs are separated, maybe wait some time until they can at least theoretically span a network.")
+            exit(1)
 
         # Find the best new edge and add it to the mst
         # Therefore just take the edge with the highest score
-        # If there is a tie, select the edge with the best snr
-        bestedges = edge_list.most_common_all()
-        if len(bestedges) > 1:
-            snrscore = collections_enhanced.Counter()
-            for edge in bestedges:
-                snrscore[edge] = graphname.edge[edge[0]][edge[1]]["snr"]
-            bestedge = snrscore.most_common(1)[0]
-            bestedge_node_a = bestedge[0][0]
-            bestedge_node_b = bestedge[0][1]
-            highest_score = bestedge[1]
-        else:
-            (bestedge_node_a, bestedge_node_b), highest_score = edge_list.most_common(1)[0]
+        # If there is a tie, the frontier selects the edge with the best snr
+        if stats is not None:
+            stats.frontier_sizes.append(len(frontier))
+        (bestedge_node_a, bestedge_node_b, bestedge), highest_score = frontier.pop()
+        if trace is not None:
+            trace.emit("st-edge", a=topology.names[bestedge_node_a], b=topology.names[bestedge_node_b], score=highest_score)
 
         # Mark node as visited
-        visited_nodes.add(bestedge_node_b)
+        visited_nodes[bestedge_node_b] = True
+        nr_visited_nodes += 1
+
+        # Remove all edges which do not see new nodes any longer (keep only productive edges)
+        for (a, b, edge) in frontier_edges_to.pop(bestedge_node_b):
+            if (a, b, edge) in frontier:
+                frontier.remove((a, b, edge))
+            for module in (a, b):
+                if module in frontier_edges_at:
+                    frontier_edges_at[module].discard((a, b, edge))
 
         # Add the edge to mst
-        mst.add_edge(bestedge_node_a, bestedge_node_b)
-        for key in graphname.edge[bestedge_node_a][bestedge_node_b].keys():
-            mst.edge[bestedge_node_a][bestedge_node_b][key] = graphname.edge[bestedge_node_a][bestedge_node_b][key]
+        mst_edges.append((bestedge_node_a, bestedge_node_b, bestedge))
+
+        # Update the scores, because scores might change, since we added new edge => score of others could get decreased
+        # Only a new real edge changes the mst for the scoring, since fake edges are neither counted nor make a module used.
+        # It merges the channel groups of its two modules and makes those modules used,
+        # but a used module only interferes with an edge if it is in one of the channel groups of the edge.
+        # So only the real frontier edges which touch the merged channel group can change their score, all others keep theirs.
+        if is_module[bestedge_node_a] and is_module[bestedge_node_b]:
+            context.add_edge(bestedge_node_a, bestedge_node_b)
+            dirty_edges = set()
+            for module in context.channel_groups.get_modules(bestedge_node_a):
+                if module in frontier_edges_at:
+                    dirty_edges.update(frontier_edges_at[module])
+            dirty_edges = list(dirty_edges)
+            dirty_scores = calculate_scores_for_compiled_edges(context, [a for a, b, edge in dirty_edges], [b for a, b, edge in dirty_edges], [edge for a, b, edge in dirty_edges])
+            for (a, b, edge), score in zip(dirty_edges, dirty_scores.tolist()):
+                frontier.push((a, b, edge), score, edge_snr[edge])
+            rescored += len(dirty_edges)
+            scored += len(dirty_edges)
+            rescoring_skipped += len(frontier) - len(dirty_edges)
+        else:
+            rescoring_skipped += len(frontier)
 
-        # Add its edges to the edge_list
-        for neighbor in graphname.neighbors(bestedge_node_b):
-            if neighbor not in visited_nodes:
-                edge_list[(bestedge_node_b, neighbor)] = calculate_score_for_edge(mst, graphname, bestedge_node_b, neighbor, wlan_modules)
+        # Add its edges to the frontier
+        new_edges = [(bestedge_node_b, neighbor, edge) for neighbor, edge in topology.incident_edges(bestedge_node_b) if not visited_nodes[neighbor]]
+        new_scores = calculate_scores_for_compiled_edges(context, [a for a, b, edge in new_edges], [b for a, b, edge in new_edges], [edge for a, b, edge in new_edges])
+        for (a, b, edge), score in zip(new_edges, new_scores.tolist()):
+            frontier.push((a, b, edge), score, edge_snr[edge])
+            frontier_edges_to.setdefault(b, list()).append((a, b, edge))
+            if is_module[a] and is_module[b]:
+                frontier_edges_at.setdefault(a, set()).add((a, b, edge))
+                frontier_edges_at.setdefault(b, set()).add((a, b, edge))
+        scored += len(new_edges)
 
-        # Remove the edge from edgelist, to speed up things since we dont need it any longer (since we are using it)
-        del edge_list[(bestedge_node_a, bestedge_node_b)]
+    logger.info("Rescored " + str(rescored) + " frontier edges, skipped " + str(rescoring_skipped) + " rescorings")
+    if stats is not None:
+        stats.counters["rescored"] += rescored
+        stats.counters["rescoring-skipped"] += rescoring_skipped
+        stats.counters["score-evaluations"] += scored
+        stats.phase_seconds["st"] += time.time() - start_time
 
-        # Update the scores, because scores might change, since we added new edge => score of others could get decreased
-        # Todo: this could be made more efficient, by just updating those edges, where sth has changed instead of all, find out if this would be a performance killer first
-        for (a, b) in edge_list:
-            edge_list[(a, b)] = calculate_score_for_edge(mst, graphname, a, b, wlan_modules)
+    return topology.to_networkx(mst_edges, graphname)
 
-    return mst
+
+def get_devices_of_compiled_topology(topology):
+    """ Returns a list with the names of all nodes of the compiled topology which are not modules (the devices)"""
+    return [node for (node, node_is_module) in zip(topology.names, topology.is_module.tolist()) if not node_is_module]
 
 
-def calculate_survival_links(mst_original, basic_con_graph):
+def calculate_tree_score(topology, tree_edges):
+    """ Global objective to compare trees over the same basic connectivity graph, a higher score is better
+
+    The score is the sum of the Edgescores of all module-module edges of the tree,
+    where every edge is scored against the complete tree (all its channel groups and used modules)
+
+    Keyword arguments:
+    topology -- CompiledTopology of the basic connectivity graph
+    tree_edges -- list of (node_a, node_b, edge id) tuples of the tree
+    returns score as float
+    """
+
+    context = PlanningContext(topology)
+    real_edges = [(a, b, edge) for a, b, edge in tree_edges if topology.edge_is_real[edge]]
+    for a, b, edge in real_edges:
+        context.add_edge(a, b)
+    scores = calculate_scores_for_compiled_edges(context, [a for a, b, edge in real_edges], [b for a, b, edge in real_edges], [edge for a, b, edge in real_edges])
+    return float(scores.sum())
+
+
+# The basic connectivity graph and its topology of the worker processes of calculate_st_multi_start
+multi_start_graph = None
+multi_start_topology = None
+
+
+def init_multi_start_worker(graphname):
+    """ Compiles the basic connectivity graph once per worker process of calculate_st_multi_start"""
+    global multi_start_graph, multi_start_topology
+    multi_start_graph = graphname
+    multi_start_topology = compiled_topology.CompiledTopology(graphname)
+
+
+def calculate_st_for_start(start_node):
+    """ Calculates the tree from start_node in a worker process of calculate_st_multi_start
+
+    returns (start_node, list of the tree edges as (name_a, name_b) in the order they were added, score, seconds)
+    """
+    start_time = time.time()
+    mst = calculate_st(multi_start_graph, topology=multi_start_topology, start_node=start_node)
+    tree_edges = multi_start_topology.ids_of_edges(mst)
+    score = calculate_tree_score(multi_start_topology, tree_edges)
+    names = multi_start_topology.names
+    return start_node, [(names[a], names[b]) for a, b, edge in tree_edges], score, time.time() - start_time
+
+
+def calculate_st_multi_start(graphname, nr_starts=None, seed=None, processes=None, start_reports=None):
+    """ Calculates the maximal spanning tree from several start devices in a process pool and returns the best one
+
+    The trees get compared with calculate_tree_score, on a tie the first start wins.
+
+    Keyword arguments:
+    graphname -- undirected NetworkX Graph like for calculate_st
+    nr_starts -- number of start devices, which are drawn with the given seed, every device is a start if it is not given
+    seed -- seed for drawing the start devices
+    processes -- number of worker processes, default is the number of cpus, with 1 everything runs in this process
+    start_reports -- optional list, which gets a dict with "start", "score" and "seconds" appended for each start
+    returns an undirected MST NetworkX Graph
+    """
+
+    topology = compiled_topology.CompiledTopology(graphname)
+    # Check once up front, a worker that hits the exit in calculate_st would never report back to the pool
+    if not topology.is_connected():
+        logger.error("Could not connect all nodes.")
+        logger.error("Graph / APs are separated, maybe wait some time until they can at least theoretically span a network.")
+        exit(1)
+    devices = get_devices_of_compiled_topology(topology)
+    if nr_starts is not None and nr_starts < len(devices):
+        devices = random.Random(seed).sample(devices, nr_starts)
+
+    logger.info("Calculating MST from " + str(len(devices)) + " start devices...")
+    if processes == 1:
+        init_multi_start_worker(graphname)
+        results = [calculate_st_for_start(start_node) for start_node in devices]
+    else:
+        pool = multiprocessing.Pool(processes, init_multi_start_worker, (graphname,))
+        try:
+            results = pool.map(calculate_st_for_start, devices)
+        finally:
+            pool.close()
+            pool.join()
+
+    best_result = None
+    for start_node, tree_edges, score, seconds in results:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Tree from " + str(start_node) + " has score " + str(score) + " and took " + str(seconds) + " seconds")
+        if start_reports is not None:
+            start_reports.append({"start": start_node, "score": score, "seconds": seconds})
+        if best_result is None or score > best_result[2]:
+            best_result = (start_node, tree_edges, score)
+
+    start_node, tree_edges, score = best_result
+    logger.info("Best tree starts at " + str(start_node) + " with score " + str(score))
+    index = topology.index
+    return topology.to_networkx([(index[a], index[b], topology.edge_id(index[a], index[b])) for a, b in tree_edges], graphname)
+
+
+def get_group_edge_positions(topology, channel_groups, tree, edges):
+    """ Returns a dict, which maps the root of each channel group to the sorted positions of its module-module edges
+
+    The position of an edge is the tin of its deeper node in the tree, so the edges of a group in a subtree
+    are a range of the positions (see count_group_edges_in_subtree).
+
+    Keyword arguments:
+    topology -- CompiledTopology of the basic connectivity graph
+    channel_groups -- ChannelGroups of the graph
+    tree -- SpanningTreeCover of the graph
+    edges -- list of (node_a, node_b, edge id) tuples of the graph
+    """
+    is_module = topology.is_module
+    group_edge_positions = dict()
+    for node_a, node_b, edge in edges:
+        if is_module[node_a] and is_module[node_b]:
+            group_edge_positions.setdefault(channel_groups.find(node_a), list()).append(max(tree.tin[node_a], tree.tin[node_b]))
+    for positions in group_edge_positions.values():
+        positions.sort()
+    return group_edge_positions
+
+
+def count_group_edges_in_subtree(positions, tree, node):
+    """ Returns the number of edges of a channel group (with the given sorted positions) in the subtree of node"""
+    return bisect.bisect_left(positions, tree.tout[node]) - bisect.bisect_left(positions, tree.tin[node])
+
+
+def calculate_survival_links(mst_original, basic_con_graph, topology=None, stats=None, trace=None):
     """ Finds the best backup links for a given mst graph
 
+    Every module-module edge which is a bridge (its failure separates the graph) gets the best scoring edge
+    of the basic graph between the two separated parts as backup link.
+    The edges are checked in the order of mst_original.edges() and every backup protects all bridges on its tree path,
+    so a bridge is only checked against the tree and the backups added so far.
+
     Keyword arguments:
     mst -- undirected weighted NetworkX Maximal spanning tree we created in step 1
     basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    stats -- optional PlanningStats which gets the counters and the wall time of this run added
+    trace -- optional planner_trace.PlannerTrace which gets each backup choice
     returns a 2-edge-connected MST NetworkX graph
     """
 
     logger.info("Calculating Survival links for Graph...")
-
-    wlan_modules = get_modules_of_graph(basic_con_graph)
-
-    mst = copy.deepcopy(mst_original)
-
-    mst_edges = copy.copy(mst.edges())
-    for edge in mst_edges:
+    if stats is not None:
+        start_time = time.time()
+
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    context = PlanningContext(topology)
+    is_module = topology.is_module
+    names = topology.names
+
+    # Work on the node ids, the backups get added to a view on top of the mst
+    # adjacency[node] maps each neighbor of node in the mst to the id of the edge in between
+    mst_edges = topology.ids_of_edges(mst_original)
+    mst_view = compiled_topology.TopologyView(topology, [edge for node_a, node_b, edge in mst_edges])
+    robust_view = mst_view.derive()
+    adjacency = mst_view.adjacency()
+
+    # Root the mst once, the subtree of each node is the range tin[node] <= tin < tout[node]
+    tree = SpanningTreeCover(adjacency, 0)
+    if len(tree.order) != topology.node_count:
+        logger.error("Could not split graph into two groups")
+        return 1
+    if stats is not None:
+        stats.counters["bfs-node-visits"] += len(tree.order)
+    tin = tree.tin_array
+
+    # Edges of mst_original which are not in the tree protect its path like a backup
+    for node_a, node_b, edge in mst_edges:
+        if tree.parent_edge[node_a] != edge and tree.parent_edge[node_b] != edge:
+            tree.cover_path(node_a, node_b)
+
+    # Channel groups of the mst, each group keeps the sorted positions of its module-module edges
+    # The position of an edge is the tin of its deeper node, so the edges of a group in a subtree are a range of the positions
+    context.set_working_graph(adjacency)
+    channel_groups = context.channel_groups
+    group_edge_positions = get_group_edge_positions(topology, channel_groups, tree, mst_edges)
+
+    for node_a, node_b, edge in mst_edges:
 
         # Simulate each edge failing
-        if edge[0] in wlan_modules and edge[1] in wlan_modules:
-
-            mst.remove_edge(edge[0], edge[1])
-            # Check if there still is a path to get to edge[1] even if this edge has failed
-            # If we have still a path to edge[1], then we are done
-            # else select second highest rated edge to get there
-            if not nx.has_path(mst, edge[0], edge[1]):
-                logger.debug("Edge " + str(edge) + " has no backup, searching one")
-                edge_list = collections_enhanced.Counter()
-
-                connected_components = nx.connected_components(mst)
-                if len(connected_components) != 2:
-                    logger.error("Could not split graph into two groups")
-                    return 1
-
-                # Create Group A and B
-                if edge[0] in connected_components[0]:
-                    group0 = connected_components[0]
-                    group1 = connected_components[1]
-                else:
-                    group0 = connected_components[1]
-                    group1 = connected_components[0]
-
-                # Find edges connecting Group A and B
-                connecting_edges = list()
-                for cedge in basic_con_graph.edges():
-                    if cedge[0] in group0 and cedge[1] in group1 or cedge[0] in group1 and cedge[1] in group0:
-                        if not ((cedge[0] == edge[0] and cedge[1] == edge[1]) or (cedge[1] == edge[0] and cedge[0] == edge[1])):
-                            connecting_edges.append(cedge)
-
-                # Calculate scores for those survival edges
-                for con_edge in connecting_edges:
-                    edge_list[(con_edge[0], con_edge[1])] = calculate_score_for_edge(mst, basic_con_graph, con_edge[0], con_edge[1], wlan_modules)
-
-                # If there is no connection that reconnects the two groups, then we can't do anything about it
-                if len(connecting_edges) == 0:
-                    logger.warning("Could not find backup for edge " + str(edge))
-                    continue
-
-                # Add edges with higest score that connects those two groups to the graph
-                (bestedge_node_a, bestedge_node_b), highest_score = edge_list.most_common(1)[0]
-
-                logger.debug("The backup for edge " + str(edge) + " is: ('" + str(bestedge_node_a) + "', '" + str(bestedge_node_b) + "')")
-
-                mst.add_edge(bestedge_node_a, bestedge_node_b)
-                mst.edge[bestedge_node_a][bestedge_node_b]["backup-link"] = True
-                for key in basic_con_graph.edge[bestedge_node_a][bestedge_node_b].keys():
-                    mst.edge[bestedge_node_a][bestedge_node_b][key] = basic_con_graph.edge[bestedge_node_a][bestedge_node_b][key]
+        if is_module[node_a] and is_module[node_b]:
+
+            # If we have still a path to node_b, then we are done
+            # else select the highest rated edge to get there
+            if stats is not None:
+                stats.counters["survival-path-checks"] += 1
+            if tree.parent_edge[node_b] == edge:
+                child = node_b
+            elif tree.parent_edge[node_a] == edge:
+                child = node_a
             else:
-                logger.debug("Edge " + str(edge) + " already has backup, moving to next edge")
+                child = None
+            if child is None or tree.is_covered(child):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Edge " + str((names[node_a], names[node_b])) + " already has backup, moving to next edge")
+                continue
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Edge " + str((names[node_a], names[node_b])) + " has no backup, searching one")
+
+            # Find edges connecting the subtree of child and the rest
+            low = tree.tin[child]
+            high = tree.tout[child]
+            connecting_edges = tree.get_crossing_edges(topology, child, edge)
+
+            # If there is no connection that reconnects the two groups, then we can't do anything about it
+            if len(connecting_edges) == 0:
+                logger.warning("Could not find backup for edge " + str((names[node_a], names[node_b])))
+                if trace is not None:
+                    trace.emit("no-backup", a=names[node_a], b=names[node_b])
+                continue
+
+            # Calculate scores for those survival edges, on the graph where the edge failed
+            # The failed edge splits its channel group into the modules in the subtree of child and the others
+            root = channel_groups.find(node_a)
+            inside_edge_count = count_group_edges_in_subtree(group_edge_positions[root], tree, child) - 1
+            context.split_channel_group(root, tin, low, high, inside_edge_count)
+            con_nodes_a = topology.edge_u[connecting_edges]
+            con_nodes_b = topology.edge_v[connecting_edges]
+            con_scores = calculate_scores_for_compiled_edges(context, con_nodes_a, con_nodes_b, connecting_edges)
+            context.join_channel_group()
+            if stats is not None:
+                stats.counters["score-evaluations"] += len(connecting_edges)
+            edge_list = collections_enhanced.Counter()
+            for con_node_a, con_node_b, con_edge, score in zip(con_nodes_a.tolist(), con_nodes_b.tolist(), connecting_edges, con_scores.tolist()):
+                edge_list[(con_node_a, con_node_b, con_edge)] = score
+
+            # Add edges with higest score that connects those two groups to the graph
+            (bestedge_node_a, bestedge_node_b, bestedge), highest_score = edge_list.most_common(1)[0]
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("The backup for edge " + str((names[node_a], names[node_b])) + " is: ('" + str(names[bestedge_node_a]) + "', '" + str(names[bestedge_node_b]) + "')")
+            if trace is not None:
+                trace.emit("backup", a=names[node_a], b=names[node_b], backup=[names[bestedge_node_a], names[bestedge_node_b]],
+                           score=highest_score, candidates=len(connecting_edges))
+
+            robust_view.add_edge(bestedge)
+            tree.cover_path(bestedge_node_a, bestedge_node_b)
+            if is_module[bestedge_node_a] and is_module[bestedge_node_b]:
+                root_a = channel_groups.find(bestedge_node_a)
+                root_b = channel_groups.find(bestedge_node_b)
+                context.add_edge(bestedge_node_a, bestedge_node_b)
+                root = channel_groups.find(bestedge_node_a)
+                positions = group_edge_positions.setdefault(root, list())
+                for old_root in (root_a, root_b):
+                    if old_root != root and old_root in group_edge_positions:
+                        for position in group_edge_positions.pop(old_root):
+                            bisect.insort(positions, position)
+                bisect.insort(positions, max(tree.tin[bestedge_node_a], tree.tin[bestedge_node_b]))
+
+    # Convert back to NetworkX, keeping the nodes of the mst
+    mst = robust_view.to_networkx(mst_original)
+    for bestedge in robust_view.added:
+        mst.edge[names[topology.edge_u[bestedge]]][names[topology.edge_v[bestedge]]]["backup-link"] = True
+
+    if stats is not None:
+        stats.phase_seconds["survival"] += time.time() - start_time
+    return mst
 
-            # Add the removed edge again
-            mst.add_edge(edge[0], edge[1])
-            for key in basic_con_graph.edge[edge[0]][edge[1]].keys():
-                mst.edge[edge[0]][edge[1]][key] = basic_con_graph.edge[edge[0]][edge[1]][key]
 
-    return mst
+def get_ap_links(topology, view):
+    """ Returns the AP of each node and the links between APs of a view
+
+    An AP is a device together with its modules, it is identified by the id of its device.
+    Only module-module edges between different APs are links, edges inside an AP do not separate anything if they fail.
+
+    Keyword arguments:
+    topology -- CompiledTopology of the basic connectivity graph
+    view -- compiled_topology.TopologyView with the edges of the graph
+    returns (list with the AP id of each node id, list of (ap_a, ap_b, edge id) tuples)
+    """
+    ap_of = [node if module_of < 0 else module_of for node, module_of in enumerate(topology.module_of.tolist())]
+    links = list()
+    for edge in view.edges():
+        if topology.edge_is_real[edge]:
+            ap_a = ap_of[topology.edge_u[edge]]
+            ap_b = ap_of[topology.edge_v[edge]]
+            if ap_a != ap_b:
+                links.append((ap_a, ap_b, edge))
+    return ap_of, links
 
 
-def get_connected_channels_for_edge(graphname, node_a, node_b, wlan_modules):
-    """ Accumulate the channel group
+def find_failure_sets(aps, links, seed=0):
+    """ Finds all link failures, pairs of link failures and AP failures which separate the APs, in one depth-first search
 
-    Returns the number of connected occurences for a certain channel at a module
-    It counts all the connected edges of the same channel (over multiple modules)
+    Bridges and articulation points come from the low values of the search.
+    For the pairs every link which is not in the search tree gets a random 64 bit label, and every tree link the xor
+    of the labels of the non-tree links over it (the xor of its subtree). Two links separate the graph
+    if and only if they have the same label (with very high probability), links with label 0 are bridges.
 
     Keyword arguments:
-    graphname -- NetworkX Graph which is to be channel assigned
-    node_a, node_b -- The nodes of the edge we want to get the channelgroup for
-    wlan_modules -- list of names of nodes of the basic_con_graph
+    aps -- list with the ids of the APs
+    links -- list of (ap_a, ap_b, edge id) tuples, there may be several links between two APs
+    seed -- seed for the labels
+    returns (list of bridges, list of cut sets, list of articulation APs, True if all APs are connected)
+            where the bridges are edge ids and each cut set is a list of edge ids, of which every pair separates the graph,
+            if the APs are not connected the lists are empty
+    """
+    rnd = random.Random(seed)
+    incident = dict((ap, list()) for ap in aps)
+    for ap_a, ap_b, edge in links:
+        incident[ap_a].append((ap_b, edge))
+        incident[ap_b].append((ap_a, edge))
+
+    tin = dict()
+    low = dict()
+    parent_edge = dict()
+    subtree_xor = dict((ap, 0) for ap in aps)
+    edge_label = dict()
+    articulation_aps = list()
+
+    root = aps[0]
+    tin[root] = 0
+    low[root] = 0
+    parent_edge[root] = None
+    root_children = 0
+    stack = [(root, iter(incident[root]))]
+    while stack:
+        ap, neighbors = stack[-1]
+        for neighbor, edge in neighbors:
+            if edge == parent_edge[ap]:
+                continue
+            if neighbor not in tin:
+                parent_edge[neighbor] = edge
+                tin[neighbor] = low[neighbor] = len(tin)
+                stack.append((neighbor, iter(incident[neighbor])))
+                if ap == root:
+                    root_children += 1
+                break
+            if tin[neighbor] < tin[ap]:
+                # Back link, it gets a random label which goes up to the tree links on its cycle
+                low[ap] = min(low[ap], tin[neighbor])
+                label = rnd.getrandbits(64)
+                edge_label[edge] = label
+                subtree_xor[ap] ^= label
+                subtree_xor[neighbor] ^= label
+        else:
+            stack.pop()
+            if stack:
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[ap])
+                if parent != root and low[ap] >= tin[parent] and (not articulation_aps or articulation_aps[-1] != parent):
+                    articulation_aps.append(parent)
+                edge_label[parent_edge[ap]] = subtree_xor[ap]
+                subtree_xor[parent] ^= subtree_xor[ap]
+    if root_children > 1:
+        articulation_aps.append(root)
+
+    # The search did not reach all APs, so the links of the other parts have no labels
+    if len(tin) != len(aps):
+        return list(), list(), list(), False
+
+    bridges = [edge for edge, label in edge_label.items() if label == 0]
+    edges_of_label = dict()
+    for ap_a, ap_b, edge in links:
+        if edge_label[edge] != 0:
+            edges_of_label.setdefault(edge_label[edge], list()).append(edge)
+    cut_sets = [edges for edges in edges_of_label.values() if len(edges) > 1]
+    return sorted(bridges), sorted(cut_sets), sorted(set(articulation_aps)), len(tin) == len(aps)
+
+
+def analyse_failures(graphname, basic_con_graph, topology=None):
+    """ Reports which link failures, pairs of link failures and AP failures separate the mesh of graphname
 
-    Returns a set of tuples, where each tuple represents a connection
+    Keyword arguments:
+    graphname -- undirected NetworkX graph, usually the result of calculate_survival_links
+    basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    returns a dict with
+                "connected" - True if all APs are connected
+                "bridges" - list of links (module pairs) whose failure separates the mesh
+                "link-cut-sets" - list of lists of links, where the failure of any two links of a list separates the mesh
+                "aps" - list of devices whose failure (with their modules) separates the mesh
     """
 
-    channel_group = set()
-    modules_todo = list()
-    if node_a in wlan_modules:
-        modules_todo.append(node_a)
-    if node_b in wlan_modules:
-        modules_todo.append(node_b)
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    names = topology.names
+    view = compiled_topology.TopologyView(topology, [edge for node_a, node_b, edge in topology.ids_of_edges(graphname)])
+    ap_of, links = get_ap_links(topology, view)
+    aps = sorted(set(ap_of))
+    bridges, cut_sets, articulation_aps, connected = find_failure_sets(aps, links)
 
-    channel_group.add((node_a, node_b))
+    def link_names(edge):
+        return sorted((names[topology.edge_u[edge]], names[topology.edge_v[edge]]))
 
-    for module in modules_todo:
-        neighbors = graphname.neighbors(module)
-        for neighbor in neighbors:
-            if neighbor in wlan_modules and neighbor not in modules_todo:
-                modules_todo.append(neighbor)
-                channel_group.add((module, neighbor))
+    return {"connected": connected,
+            "bridges": [link_names(edge) for edge in bridges],
+            "link-cut-sets": [[link_names(edge) for edge in cut_set] for cut_set in cut_sets],
+            "aps": [names[ap] for ap in articulation_aps]}
 
-    return channel_group
 
+def calculate_multi_failure_links(graphname, basic_con_graph, topology=None, trace=None):
+    """ Adds backup links, so that no pair of link failures and no AP failure separates the mesh, where possible
 
-def count_local_interference(graphname, connectivity_graph, channel_group, wlan_modules):
-    """ Counts which channels interfere for a given channel-group
+    Works like calculate_survival_links on the remaining failure sets of find_failure_sets:
+    the graph without the failed links / AP gets the best scoring edge of the basic graph from its smallest
+    part to the rest as backup link, until there are no failure sets left which can be fixed.
 
     Keyword arguments:
-    graphname --
-    connectivity_graph -- A NetworkX Graph which represents the basic connectivity
-    channel_group -- A List of tuples which represent links in a channel-group
-    wlan_modules -- List of nodenames of graphname which are modules, the rest (all nodes - modules) are device nodes
-
-    Requires the module-nodes of graphname to have the following attributes:
-    "seen_channels"  which is a list of foreign wlans like [1,6,11,11,36]
-    "channel" which is None if no channel is assigned to that node or the channel which has been assigned to that connection
-
-    Returns two collections_enhanced.Counter with the number of internal interference counts for each channel and external interference
+    graphname -- undirected NetworkX graph, usually the result of calculate_survival_links
+    basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    trace -- optional planner_trace.PlannerTrace which gets each backup choice
+    returns a NetworkX graph with the additional edges marked as "backup-link"
     """
 
-    internal_channel_counter = collections_enhanced.Counter()
-    external_channel_counter = collections_enhanced.Counter()
-    modules = set()
-
-    for (module_a, module_b) in channel_group:
-        modules.add(module_a)
-        modules.add(module_b)
+    logger.info("Calculating backup links for multiple failures...")
+
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    context = PlanningContext(topology)
+    names = topology.names
+    is_module = topology.is_module
+    view = compiled_topology.TopologyView(topology, [edge for node_a, node_b, edge in topology.ids_of_edges(graphname)]).derive()
+    ap_of = get_ap_links(topology, view)[0]
+    nodes_of_ap = dict()
+    for node, ap in enumerate(ap_of):
+        nodes_of_ap.setdefault(ap, list()).append(node)
+    aps = sorted(nodes_of_ap)
+    unfixable = set()
 
-    logger.debug("  Interferences for channel-group: " + str(channel_group))
-    logger.debug("      Modules are: " + str(modules))
+    while True:
+        links = get_ap_links(topology, view)[1]
+        bridges, cut_sets, articulation_aps, connected = find_failure_sets(aps, links)
+        if not connected:
+            logger.error("Graph / APs are separated, can not protect against multiple failures")
+            break
+
+        # Failure sets as (failed links, failed AP)
+        failure_sets = [((edge,), None) for edge in bridges]
+        for cut_set in cut_sets:
+            failure_sets.extend(((edge_a, edge_b), None) for edge_a, edge_b in zip(cut_set, cut_set[1:]))
+        failure_sets.extend(((), ap) for ap in articulation_aps)
+        failure_sets = [failure_set for failure_set in failure_sets if failure_set not in unfixable]
+        if not failure_sets:
+            break
+        failed_edges, failed_ap = failure_sets[0]
+
+        # Simulate the failure and find the parts of the mesh
+        failed_view = view.derive()
+        for edge in failed_edges:
+            failed_view.remove_edge(edge)
+        if failed_ap is not None:
+            for node in nodes_of_ap[failed_ap]:
+                for neighbor, edge in failed_view.neighbors(node):
+                    failed_view.remove_edge(edge)
+        part_of = dict()
+        parts = list()
+        ap_adjacency = dict((ap, list()) for ap in aps)
+        for ap_a, ap_b, edge in get_ap_links(topology, failed_view)[1]:
+            ap_adjacency[ap_a].append(ap_b)
+            ap_adjacency[ap_b].append(ap_a)
+        for ap in aps:
+            if ap in part_of or ap == failed_ap:
+                continue
+            part = [ap]
+            part_of[ap] = len(parts)
+            for part_ap in part:
+                for neighbor in ap_adjacency[part_ap]:
+                    if neighbor not in part_of:
+                        part_of[neighbor] = len(parts)
+                        part.append(neighbor)
+            parts.append(part)
+        smallest_part = min(range(len(parts)), key=lambda part: len(parts[part]))
+
+        # Candidates are the module-module edges of the basic graph from the smallest part to the other parts, which are not in the graph yet
+        side = [node for ap in parts[smallest_part] for node in nodes_of_ap[ap] if is_module[node]]
+        neighbors, edges = topology.incident_edges_of_nodes(side)
+        connecting_edges = sorted(set(edge for neighbor, edge in zip(neighbors.tolist(), edges.tolist())
+                                      if is_module[neighbor] and ap_of[neighbor] != failed_ap and part_of.get(ap_of[neighbor]) != smallest_part
+                                      and not view.has_edge(edge)))
+        if not connecting_edges:
+            logger.warning("Could not find backup for failure of " + str([(names[topology.edge_u[edge]], names[topology.edge_v[edge]]) for edge in failed_edges]) +
+                           ("" if failed_ap is None else " AP " + str(names[failed_ap])))
+            unfixable.add((failed_edges, failed_ap))
+            continue
 
-    for module in modules:
+        # Add the edge with the highest score on the graph with the failure
+        context.set_working_graph(failed_view.adjacency())
+        con_nodes_a = topology.edge_u[connecting_edges]
+        con_nodes_b = topology.edge_v[connecting_edges]
+        con_scores = calculate_scores_for_compiled_edges(context, con_nodes_a, con_nodes_b, connecting_edges)
+        edge_list = collections_enhanced.Counter()
+        for con_edge, score in zip(connecting_edges, con_scores.tolist()):
+            edge_list[con_edge] = score
+        bestedge, highest_score = edge_list.most_common(1)[0]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("The backup for failure set " + str((failed_edges, failed_ap)) + " is: ('" + str(names[topology.edge_u[bestedge]]) + "', '" + str(names[topology.edge_v[bestedge]]) + "')")
+        if trace is not None:
+            trace.emit("multi-backup", links=[[names[topology.edge_u[edge]], names[topology.edge_v[edge]]] for edge in failed_edges],
+                       ap=None if failed_ap is None else names[failed_ap], backup=[names[topology.edge_u[bestedge]], names[topology.edge_v[bestedge]]])
+        view.add_edge(bestedge)
+
+    graph = view.to_networkx(graphname)
+    for edge in view.added:
+        graph.edge[names[topology.edge_u[edge]]][names[topology.edge_v[edge]]]["backup-link"] = True
+    for failure_set in sorted(unfixable):
+        logger.warning("Failure set stays unprotected: " + str(failure_set))
+    return graph
+
+
+def get_failover_key(module_a, module_b):
+    """ Returns the key of the link between module_a and module_b in a failover table"""
+    return " ".join(sorted((str(module_a), str(module_b))))
+
+
+def calculate_failover_table(mst_graph, robust_graph, basic_con_graph, allowed_channel_list, topology=None):
+    """ Precomputes for every module-module link of the tree which backup link to activate if it fails
+
+    The tree is the plan without backup links (with the channels of calculate_ca), the backup links are the additional
+    edges of robust_graph (from calculate_survival_links). For each link the best scoring backup which reconnects
+    the two parts of the tree gets selected, on the tree without the failed link like in calculate_survival_links.
+    Activating the backup needs both of its modules on the same channel, the channel changes for this are:
+        - nothing, if both modules already use the same channel
+        - the channel of the other module for an unused module
+        - the channel of the other module for all modules of the smaller channel group, if both channels differ
+        - the channel with the least local interference from allowed_channel_list, if both modules are unused
 
-        neighbors = connectivity_graph.neighbors(module)
+    Keyword arguments:
+    mst_graph -- undirected NetworkX graph - the tree with channels assigned
+    robust_graph -- undirected NetworkX graph - the tree with the backup links
+    basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    allowed_channel_list -- list of channels a backup link may get if both of its modules are unused
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    returns a dict, which maps get_failover_key of each link to a dict with
+                "backup" - list with the two modules of the backup link, None if there is no backup
+                "channels" - dict which maps each module that has to change its channel to its new channel
+    """
 
-        for neighbor in neighbors:
+    logger.info("Calculating failover table...")
+
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    context = PlanningContext(topology)
+    is_module = topology.is_module
+    names = topology.names
+    index = topology.index
+
+    mst_edges = topology.ids_of_edges(mst_graph)
+    mst_view = compiled_topology.TopologyView(topology, [edge for node_a, node_b, edge in mst_edges])
+    backup_edges = [edge for node_a, node_b, edge in topology.ids_of_edges(robust_graph) if not mst_view.has_edge(edge)]
+    adjacency = mst_view.adjacency()
+    tree = SpanningTreeCover(adjacency, 0)
+    context.set_working_graph(adjacency)
+    channel_groups = context.channel_groups
+    group_edge_positions = get_group_edge_positions(topology, channel_groups, tree, mst_edges)
+
+    node_channels = [None] * topology.node_count
+    seen_channels = dict()
+    for node in mst_graph.nodes():
+        if is_module[index[node]]:
+            node_channels[index[node]] = mst_graph.node[node].get("channel")
+            seen_channels[index[node]] = mst_graph.node[node].get("seen_channels", [])
+    interference = InterferenceMatrix(context, allowed_channel_list, seen_channels)
+    for module in seen_channels:
+        interference.assign([module], node_channels[module])
+    backup_tin_a = [tree.tin[topology.edge_u[edge]] for edge in backup_edges]
+    backup_tin_b = [tree.tin[topology.edge_v[edge]] for edge in backup_edges]
+
+    failover_table = dict()
+    for node_a, node_b, edge in mst_edges:
+        if not is_module[node_a] or not is_module[node_b]:
+            continue
+        if tree.parent_edge[node_b] == edge:
+            child = node_b
+        else:
+            child = node_a
+        low = tree.tin[child]
+        high = tree.tout[child]
+        entry = {"backup": None, "channels": dict()}
+        failover_table[get_failover_key(names[node_a], names[node_b])] = entry
+
+        # The backups which connect the subtree of child with the rest
+        connecting_edges = [backup_edge for backup_edge, tin_a, tin_b in zip(backup_edges, backup_tin_a, backup_tin_b)
+                            if (low <= tin_a < high) != (low <= tin_b < high)]
+        if not connecting_edges:
+            logger.warning("No backup for link " + str((names[node_a], names[node_b])))
+            continue
 
-            logger.debug("      Neigh for module: " + str(module) + ": " + str(neighbor))
+        # Select the best one on the tree without the failed link
+        root = channel_groups.find(node_a)
+        context.split_channel_group(root, tree.tin_array, low, high, count_group_edges_in_subtree(group_edge_positions[root], tree, child) - 1)
+        con_nodes_a = topology.edge_u[connecting_edges]
+        con_nodes_b = topology.edge_v[connecting_edges]
+        con_scores = calculate_scores_for_compiled_edges(context, con_nodes_a, con_nodes_b, connecting_edges)
+        edge_list = collections_enhanced.Counter()
+        for con_node_a, con_node_b, con_edge, score in zip(con_nodes_a.tolist(), con_nodes_b.tolist(), connecting_edges, con_scores.tolist()):
+            edge_list[(con_node_a, con_node_b, con_edge)] = score
+        (backup_node_a, backup_node_b, backup_edge), highest_score = edge_list.most_common(1)[0]
+        entry["backup"] = [names[backup_node_a], names[backup_node_b]]
+
+        # Put both modules of the backup on the same channel
+        # (only a module-module backup has channels, nothing changes if both modules already share one)
+        channel_a = node_channels[backup_node_a]
+        channel_b = node_channels[backup_node_b]
+        if not is_module[backup_node_a] or not is_module[backup_node_b] or (channel_a is not None and channel_a == channel_b):
+            context.join_channel_group()
+            continue
+        if channel_a is None and channel_b is None:
+            internal_interference, external_interference = interference.count([backup_node_a, backup_node_b])
+            best_channel = allowed_channel_list[int(np.argmin(internal_interference + external_interference))]
+            entry["channels"][names[backup_node_a]] = best_channel
+            entry["channels"][names[backup_node_b]] = best_channel
+        elif channel_a is None:
+            entry["channels"][names[backup_node_a]] = channel_b
+        elif channel_b is None:
+            entry["channels"][names[backup_node_b]] = channel_a
+        else:
+            # Switch the smaller channel group (on the tree without the failed link)
+            groups = list()
+            for module in (backup_node_a, backup_node_b):
+                members = channel_groups.get_modules(module)
+                if channel_groups.find(module) == root:
+                    in_subtree = low <= tree.tin[module] < high
+                    members = [member for member in members if (low <= tree.tin[member] < high) == in_subtree]
+                groups.append(members)
+            if len(groups[1]) <= len(groups[0]):
+                switched_modules, channel = groups[1], channel_a
+            else:
+                switched_modules, channel = groups[0], channel_b
+            for module in switched_modules:
+                entry["channels"][names[module]] = channel
+        context.join_channel_group()
 
-            if neighbor in wlan_modules:
+    return failover_table
 
-                # Internal Interference
-                channel = graphname.node[neighbor]["channel"]
-                if channel:
-                    internal_channel_counter[channel] += 1
-                    logger.debug("          For " + str(module) + " : " + str(neighbor) + " @Channel:" + str(channel))
-                else:
-                    logger.debug("          Ignoring neigh: " + str(neighbor) + "(no channel)")
 
-            # External Interference
-            for external_channel in graphname.node[module]["seen_channels"]:
-                external_channel_counter[external_channel] += 1
+def write_failover_table(failover_table, filename="autowds-failover.json"):
+    """ Writes the failover table of calculate_failover_table to a json file next to the graph of write_json"""
+    with open(filename, 'w') as outfile:
+        json.dump(failover_table, outfile, indent=4, sort_keys=True)
 
-    return internal_channel_counter, external_channel_counter
 
+def read_failover_table(filename="autowds-failover.json"):
+    """ Reads a failover table written by write_failover_table"""
+    with open(filename) as infile:
+        return json.load(infile)
 
-def assign_channel_to_channel_group(channel, channel_group, graphname, overall_channel_counter):
-    """ Assigns channels to all members of this channel group"""
-    for node_a, node_b in channel_group:
-        graphname.node[node_a]["channel"] = channel
-        graphname.node[node_b]["channel"] = channel
-        graphname.edge[node_a][node_b]["channel"] = channel
 
-        # Increase overall channel counter
-        overall_channel_counter[channel] += 1
+def lookup_failover(failover_table, module_a, module_b):
+    """ Returns the failover table entry for the failed link between module_a and module_b, None if the link is not in the table"""
+    return failover_table.get(get_failover_key(module_a, module_b))
 
 
 def is_fake_edge(graphname, node_a, node_b):
@@ -536,28 +1391,114 @@ def is_real_edge(graphname, node_a, node_b):
         return True
 
 
-def has_channel_assigned(graph, node_a, node_b):
-    """ Returns True if the given edge already has a channel assigned, False if not
-    """
+class InterferenceMatrix(object):
+    """ Interference counts of all modules for the channel election, as matrices over (module, channel)
 
-    if graph.edge[node_a][node_b]["channel"]:
-        return True
-    else:
-        return False
+    The channels are the columns in the order of allowed_channel_list, other channels are not counted.
+    internal[module, channel] -- number of module neighbors of module in the basic graph which use the channel,
+                                 this is the module adjacency (CSR of the PlanningContext) times the
+                                 one-hot (module, channel) matrix of the assigned channels, kept up to date by assign
+    external[module, channel] -- number of times module has seen the foreign channel, times the number of its neighbors
+    So the interference of a channel group is the sum of the rows of its modules.
 
+    Keyword arguments:
+    context -- PlanningContext of the basic connectivity graph
+    allowed_channel_list -- list of the channels
+    seen_channels -- dict which maps the id of each module to its list of seen foreign channels
+    """
 
-def calculate_ca(graphname, basic_con_graph, allowed_channel_list):
+    def __init__(self, context, allowed_channel_list, seen_channels):
+        topology = context.topology
+        self.context = context
+        self.channels = list(allowed_channel_list)
+        self.channel_index = dict((channel, column) for column, channel in enumerate(self.channels))
+        self.node_channels = [None] * topology.node_count
+        self.internal = np.zeros((topology.node_count, len(self.channels)), dtype=np.int64)
+        self.external = np.zeros((topology.node_count, len(self.channels)), dtype=np.int64)
+        degrees = np.diff(topology.indptr)
+        for module, module_seen_channels in seen_channels.items():
+            for channel in module_seen_channels:
+                if channel in self.channel_index:
+                    self.external[module, self.channel_index[channel]] += degrees[module]
+
+    def assign(self, modules, channel):
+        """ Sets the channel of the modules, given as list of ids"""
+        for old_channel in set(self.node_channels[module] for module in modules):
+            changed_modules = [module for module in modules if self.node_channels[module] == old_channel]
+            if old_channel == channel:
+                continue
+            for module in changed_modules:
+                self.node_channels[module] = channel
+
+            # All module neighbors of the changed modules move from the column of the old channel to the new one
+            neighbors, neighbor_counts = self.count_module_neighbors(changed_modules)
+            if old_channel in self.channel_index:
+                self.internal[neighbors, self.channel_index[old_channel]] -= neighbor_counts
+            if channel in self.channel_index:
+                self.internal[neighbors, self.channel_index[channel]] += neighbor_counts
+
+    def count_module_neighbors(self, modules):
+        """ Returns two numpy arrays with the distinct module neighbors of the modules and how many of the modules each one neighbors"""
+        context = self.context
+        modules = np.asarray(modules, dtype=np.int64)
+        degrees = context.module_indptr[modules + 1] - context.module_indptr[modules]
+        slots = np.repeat(context.module_indptr[modules] - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+        return np.unique(context.module_indices[slots], return_counts=True)
+
+    def count(self, modules):
+        """ Returns two numpy arrays with the internal and external interference of the modules for each channel"""
+        modules = np.asarray(modules, dtype=np.int64)
+        return self.internal[modules].sum(axis=0), self.external[modules].sum(axis=0)
+
+
+def get_channel_group_edges(topology, graphname):
+    """ Partitions the real edges of graphname into its channel groups
+
+    Keyword arguments:
+    topology -- CompiledTopology of the basic connectivity graph of graphname
+    graphname -- undirected NetworkX graph
+    returns the ChannelGroups, the list of the roots of the groups in the order of their first edge in graphname.edges()
+            and a dict which maps each root to the list of (module_a, module_b, edge id) tuples of its group
+    """
+    is_module = topology.is_module
+    channel_groups = ChannelGroups(topology.node_count)
+    real_edges = [(node_a, node_b, edge) for node_a, node_b, edge in topology.ids_of_edges(graphname) if is_module[node_a] and is_module[node_b]]
+    for node_a, node_b, edge in real_edges:
+        channel_groups.add_edge(node_a, node_b)
+    group_edges = dict()
+    group_roots = list()
+    for node_a, node_b, edge in real_edges:
+        root = channel_groups.find(node_a)
+        if root not in group_edges:
+            group_edges[root] = list()
+            group_roots.append(root)
+        group_edges[root].append((node_a, node_b, edge))
+    return channel_groups, group_roots, group_edges
+
+
+def calculate_ca(graphname, basic_con_graph, allowed_channel_list, topology=None, stats=None, trace=None, fixed_channels=None):
     """ Assigns channel fro the allowed_channel_list to the edges of the graphname graph
 
     Keyword arguments:
     graphname -- undirected weighted NetworkX graph
     basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    stats -- optional PlanningStats which gets the counters and the wall time of this run added
+    trace -- optional planner_trace.PlannerTrace which gets each election
+    fixed_channels -- optional dict which maps module names to channels of a previous plan, a channel group whose modules
+                      all have the same allowed channel in it keeps this channel without election (see replan)
     returns a colored/channel assigned networkx graph
     """
 
     logger.info("Calculating channel assignment for graph...")
+    if stats is not None:
+        start_time = time.time()
 
-    wlan_modules = get_modules_of_graph(basic_con_graph)
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    is_module = topology.is_module
+    index = topology.index
+    names = topology.names
 
     overall_channel_counter = collections_enhanced.Counter()
     for channel in allowed_channel_list:
@@ -568,60 +1509,80 @@ def calculate_ca(graphname, basic_con_graph, allowed_channel_list):
         if is_real_edge(graphname, edge[0], edge[1]):
             graphname.edge[edge[0]][edge[1]]["channel"] = None
     for node in graphname.nodes():
-        if node in wlan_modules:
+        if is_module[index[node]]:
             graphname.node[node]["channel"] = None
             graphname.node[node]["seen_channels"] = []
 
-    # Iterate over all Edges
-    for edge in graphname.edges():
-
-        # Only assign channel to real connections
-        if is_fake_edge(graphname, edge[0], edge[1]):
-            continue
-
-        # Skip this channel group if it already has a channel assigned
-        if has_channel_assigned(graphname, edge[0], edge[1]):
-            continue
-
-        # Get the channel group for this edge
-        channel_group = get_connected_channels_for_edge(graphname, edge[0], edge[1], wlan_modules)
-
-        logger.debug("Coloring Channel-Group: " + str(channel_group))
-
-        # For each module in channel group, count the channel usages
-        internal_interference, external_interference = count_local_interference(graphname, basic_con_graph, channel_group, wlan_modules)
-        logger.debug("  Internal-Interference: " + str(internal_interference))
-        logger.debug("  External-Interference: " + str(external_interference))
+    # Work on the node ids, only the result gets written back to graphname
+    edge_channels = dict()
+    seen_channels = dict()
+    for node in graphname.nodes():
+        if is_module[index[node]]:
+            seen_channels[index[node]] = graphname.node[node]["seen_channels"]
+    interference = InterferenceMatrix(PlanningContext(topology), allowed_channel_list, seen_channels)
+    node_channels = interference.node_channels
+
+    # Partition the real edges into the channel groups once, the groups are colored in the order of their first edge
+    channel_groups, group_roots, group_edges = get_channel_group_edges(topology, graphname)
+
+    # Channel groups which keep their channel are assigned first, so the elections of the others see them
+    if fixed_channels is not None:
+        elected_roots = list()
+        for root in group_roots:
+            modules = channel_groups.get_modules(root)
+            fixed_channel = set(fixed_channels.get(names[module]) for module in modules)
+            if len(fixed_channel) != 1 or not fixed_channel.issubset(allowed_channel_list):
+                elected_roots.append(root)
+                continue
+            fixed_channel = fixed_channel.pop()
+            interference.assign(modules, fixed_channel)
+            for module_a, module_b, edge in group_edges[root]:
+                edge_channels[edge] = fixed_channel
+                overall_channel_counter[fixed_channel] += 1
+            if stats is not None:
+                stats.counters["channel-groups-kept"] += 1
+        group_roots = elected_roots
+
+    # Iterate over all channel groups
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for root in group_roots:
+        channel_group = group_edges[root]
+        modules = channel_groups.get_modules(root)
+        if stats is not None:
+            stats.counters["channel-elections"] += 1
+
+        if debug:
+            logger.debug("Coloring Channel-Group: " + str([(names[module_a], names[module_b]) for module_a, module_b, edge in channel_group]))
+
+        # For each module in channel group, count the channel usages (internal and external interference)
+        internal_interference, external_interference = interference.count(modules)
+        if debug:
+            logger.debug("  Internal-Interference: " + str(dict(zip(allowed_channel_list, internal_interference.tolist()))))
+            logger.debug("  External-Interference: " + str(dict(zip(allowed_channel_list, external_interference.tolist()))))
 
         election_counter = collections_enhanced.Counter()
-        for channel in allowed_channel_list:
-            election_counter[channel] = 0
+        for channel, votes in zip(allowed_channel_list, (internal_interference + external_interference).tolist()):
+            election_counter[channel] = votes
 
-        # Respect internal interference
-        for channel in internal_interference:
-            if channel in election_counter:
-                election_counter[channel] += internal_interference[channel]
-
-        # Respect external interference
-        for channel in external_interference:
-            if channel in election_counter:
-                election_counter[channel] += external_interference[channel]
-
-        logger.debug("  Election-Counter: " + str(election_counter))
+        if debug:
+            logger.debug("  Election-Counter: " + str(election_counter))
 
         # Select the channel that would cause the least local interference
+        tie = None
         best_channels = election_counter.least_common_all().keys()
         if len(best_channels) == 1:
             best_channel = best_channels[0]
         else:
 
             # Tie occurred, which channel has been overall used the least?
+            tie = "overall"
             second_election = collections_enhanced.Counter()
             for channel in best_channels:
                 second_election[channel] = overall_channel_counter[channel]
 
-            logger.debug("  Overall-Channel-Counter: " + str(overall_channel_counter))
-            logger.debug("  Second-Election-Counter because of tie: " + str(second_election))
+            if debug:
+                logger.debug("  Overall-Channel-Counter: " + str(overall_channel_counter))
+                logger.debug("  Second-Election-Counter because of tie: " + str(second_election))
 
             best_channels = second_election.least_common_all().keys()
             if len(best_channels) == 1:
@@ -630,11 +1591,276 @@ def calculate_ca(graphname, basic_con_graph, allowed_channel_list):
 
                 logger.debug("  Random-Pick because of tie")
 
+                tie = "random"
                 best_channel = random.choice(best_channels)
 
-        logger.debug("  Using channel " + str(best_channel) + " for channel-group")
+        if debug:
+            logger.debug("  Using channel " + str(best_channel) + " for channel-group")
+        if trace is not None:
+            trace.emit("election", modules=[names[module] for module in modules], votes=sorted(election_counter.items()), channel=best_channel, tie=tie)
 
         # Assign the best channel to the channel group
-        assign_channel_to_channel_group(best_channel, channel_group, graphname, overall_channel_counter)
+        interference.assign(modules, best_channel)
+        for module_a, module_b, edge in channel_group:
+            edge_channels[edge] = best_channel
+
+            # Increase overall channel counter
+            overall_channel_counter[best_channel] += 1
+
+    # Write the channels back to graphname
+    for module in seen_channels:
+        if node_channels[module] is not None:
+            graphname.node[names[module]]["channel"] = node_channels[module]
+    for edge in edge_channels:
+        graphname.edge[names[topology.edge_u[edge]]][names[topology.edge_v[edge]]]["channel"] = edge_channels[edge]
+
+    if stats is not None:
+        stats.phase_seconds["ca"] += time.time() - start_time
+    return graphname
+
+
+def refine_ca(graphname, basic_con_graph, allowed_channel_list, time_budget=1.0, tabu_tenure=None, max_iterations=None, topology=None, stats=None, trace=None):
+    """ Improves the channel assignment of calculate_ca with a tabu search over the channels of the channel groups
 
+    The interference of the assignment is the sum of the election counters (internal + external interference) of all
+    channel groups for their channels, without the links inside a group (every channel has them).
+    A move gives one channel group another channel, it gets scored by the change of the interference only (delta evaluation
+    on the (group, channel) interference counts, which get updated for the neighbors of the moved group only).
+    Each iteration makes the best move, even if it makes the assignment worse, and the channel the group left is
+    tabu for that group for tabu_tenure iterations, unless it would give a new best assignment (aspiration).
+    The best assignment found within the time budget is written back to graphname.
+    The time budget starts after the setup of the interference counts, and at least one move gets evaluated.
+
+    Keyword arguments:
+    graphname -- undirected NetworkX graph with the channels of calculate_ca
+    basic_con_graph -- undirected NetworkX graph - the underlying connectivity graph
+    allowed_channel_list -- list of the channels, the same as for calculate_ca
+    time_budget -- seconds the search may take (without the setup)
+    tabu_tenure -- number of iterations a left channel stays tabu, default depends on the number of channel groups
+    max_iterations -- optional maximal number of moves
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    stats -- optional PlanningStats which gets the counters and the wall time of this run added
+    trace -- optional planner_trace.PlannerTrace which gets each channel group with a new channel
+    returns graphname with the refined channels
+    """
+
+    logger.info("Refining channel assignment with tabu search...")
+    start_time = time.time()
+
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+    index = topology.index
+    names = topology.names
+
+    channel_groups, group_roots, group_edges = get_channel_group_edges(topology, graphname)
+    group_count = len(group_roots)
+    if group_count == 0 or len(allowed_channel_list) < 2:
+        return graphname
+
+    seen_channels = dict()
+    for node in graphname.nodes():
+        if topology.is_module[index[node]]:
+            seen_channels[index[node]] = graphname.node[node].get("seen_channels", [])
+    interference = InterferenceMatrix(PlanningContext(topology), allowed_channel_list, seen_channels)
+    channel_index = interference.channel_index
+
+    # (group, channel) interference counts, group_internal includes the links inside the group on the channel of the group
+    group_modules = [channel_groups.get_modules(root) for root in group_roots]
+    group_of_module = np.full(topology.node_count, -1, dtype=np.int64)
+    group_channels = np.zeros(group_count, dtype=np.int64)
+    for group, modules in enumerate(group_modules):
+        group_of_module[modules] = group
+        group_channels[group] = channel_index[graphname.node[names[modules[0]]]["channel"]]
+    group_internal = np.zeros((group_count, len(allowed_channel_list)), dtype=np.int64)
+    group_inside = np.zeros(group_count, dtype=np.int64)
+    group_external = np.zeros((group_count, len(allowed_channel_list)), dtype=np.int64)
+    group_neighbors = list()
+    for group, modules in enumerate(group_modules):
+        neighbors, neighbor_counts = interference.count_module_neighbors(modules)
+        neighbor_groups = group_of_module[neighbors]
+        assigned = neighbor_groups >= 0
+        neighbor_groups = neighbor_groups[assigned]
+        neighbor_counts = neighbor_counts[assigned]
+        group_neighbors.append((neighbor_groups, neighbor_counts))
+        np.add.at(group_internal, (neighbor_groups, group_channels[group]), neighbor_counts)
+        group_inside[group] = neighbor_counts[neighbor_groups == group].sum()
+        group_external[group] = interference.count(modules)[1]
+
+    groups = np.arange(group_count)
+    interference_sum = int((group_internal[groups, group_channels] - group_inside + group_external[groups, group_channels]).sum())
+    initial_interference = interference_sum
+    best_interference = interference_sum
+    best_channels = group_channels.copy()
+    if tabu_tenure is None:
+        tabu_tenure = max(1, min(10, group_count // 2))
+    tabu_until = np.zeros((group_count, len(allowed_channel_list)), dtype=np.int64)
+    not_allowed = np.iinfo(np.int64).max
+
+    iteration = 0
+    search_start_time = time.time()
+    while (iteration == 0 or time.time() - search_start_time < time_budget) and best_interference > 0:
+        if max_iterations is not None and iteration >= max_iterations:
+            break
+        iteration += 1
+
+        # Moving a group changes its interference and the one of its neighbor groups by the same amount
+        current_internal = group_internal[groups, group_channels] - group_inside
+        current_external = group_external[groups, group_channels]
+        deltas = 2 * (group_internal - current_internal[:, None]) + group_external - current_external[:, None]
+        allowed = (tabu_until < iteration) | (interference_sum + deltas < best_interference)
+        allowed[groups, group_channels] = False
+        deltas[~allowed] = not_allowed
+        move = int(np.argmin(deltas))
+        group, new_channel = divmod(move, len(allowed_channel_list))
+        if deltas[group, new_channel] == not_allowed:
+            break
+
+        # Delta update of the neighbor groups of the moved group
+        old_channel = group_channels[group]
+        neighbor_groups, neighbor_counts = group_neighbors[group]
+        np.add.at(group_internal, (neighbor_groups, old_channel), -neighbor_counts)
+        np.add.at(group_internal, (neighbor_groups, new_channel), neighbor_counts)
+        group_channels[group] = new_channel
+        tabu_until[group, old_channel] = iteration + tabu_tenure
+        interference_sum += int(deltas[group, new_channel])
+
+        if interference_sum < best_interference:
+            best_interference = interference_sum
+            best_channels = group_channels.copy()
+            if stats is not None:
+                stats.counters["tabu-improvements"] += 1
+
+    logger.info("Tabu search reduced the interference from " + str(initial_interference) + " to " + str(best_interference) +
+                " in " + str(iteration) + " iterations")
+
+    # Write the best channels back to graphname
+    for group, modules in enumerate(group_modules):
+        channel = allowed_channel_list[best_channels[group]]
+        if channel == graphname.node[names[modules[0]]]["channel"]:
+            continue
+        if trace is not None:
+            trace.emit("refine", modules=[names[module] for module in modules], old=graphname.node[names[modules[0]]]["channel"], channel=channel)
+        for module in modules:
+            graphname.node[names[module]]["channel"] = channel
+        for module_a, module_b, edge in group_edges[group_roots[group]]:
+            graphname.edge[names[module_a]][names[module_b]]["channel"] = channel
+
+    if stats is not None:
+        stats.counters["tabu-iterations"] += iteration
+        stats.phase_seconds["ca-refine"] += time.time() - start_time
     return graphname
+
+
+def get_basic_graph_diff(old_basic_con_graph, new_basic_con_graph, snr_tolerance=0):
+    """ Compares two basic connectivity graphs, e.g. of two reads of the Intra-WLAN-Discovery table
+
+    Keyword arguments:
+    old_basic_con_graph -- undirected NetworkX graph the previous plan was made for
+    new_basic_con_graph -- undirected NetworkX graph
+    snr_tolerance -- snr changes up to this value are ignored
+    returns a dict with
+                "added-nodes" / "removed-nodes" - lists of node names
+                "added-edges" / "removed-edges" - lists of (name_a, name_b) tuples
+                "changed-edges" - list of (name_a, name_b) tuples of the edges in both graphs whose snr changed by more than snr_tolerance
+    """
+    diff = {"added-nodes": [node for node in new_basic_con_graph.nodes() if not old_basic_con_graph.has_node(node)],
+            "removed-nodes": [node for node in old_basic_con_graph.nodes() if not new_basic_con_graph.has_node(node)],
+            "added-edges": list(),
+            "removed-edges": [(node_a, node_b) for node_a, node_b in old_basic_con_graph.edges() if not new_basic_con_graph.has_edge(node_a, node_b)],
+            "changed-edges": list()}
+    for node_a, node_b in new_basic_con_graph.edges():
+        if not old_basic_con_graph.has_edge(node_a, node_b):
+            diff["added-edges"].append((node_a, node_b))
+        elif abs(new_basic_con_graph.edge[node_a][node_b].get("snr", 0) - old_basic_con_graph.edge[node_a][node_b].get("snr", 0)) > snr_tolerance:
+            diff["changed-edges"].append((node_a, node_b))
+    return diff
+
+
+def get_channel_groups_of_graph(graphname):
+    """ Returns a dict which maps each module with a real edge in graphname to the frozenset of the modules of its channel group"""
+    real_graph = nx.Graph()
+    real_graph.add_edges_from((node_a, node_b) for node_a, node_b in graphname.edges() if is_real_edge(graphname, node_a, node_b))
+    module_groups = dict()
+    for modules in nx.connected_components(real_graph):
+        modules = frozenset(modules)
+        for module in modules:
+            module_groups[module] = modules
+    return module_groups
+
+
+def replan(previous_plan, basic_con_graph, diff, allowed_channel_list, change_threshold=0.25, topology=None, stats=None, trace=None):
+    """ Repairs a previous plan for a changed basic connectivity graph instead of planning from scratch (warm start)
+
+    The affected nodes are the nodes of all added, removed and changed edges (see get_basic_graph_diff).
+    The tree edges of the previous plan at affected nodes get dropped, the largest remaining part of the tree is kept
+    and calculate_st grows the tree from it again, so only the cut off subtrees are planned again.
+    The survival links are calculated for the repaired tree, channel groups which have the same modules as before and
+    no affected module keep their channel, only the other groups get elected again by calculate_ca.
+    If the diff has more than change_threshold * the edges of basic_con_graph entries or more than
+    change_threshold * the nodes of basic_con_graph would have to be planned again, everything gets planned from scratch.
+
+    Keyword arguments:
+    previous_plan -- undirected NetworkX graph of the previous plan, the result of calculate_ca on the result of calculate_survival_links
+    basic_con_graph -- undirected NetworkX graph - the new underlying connectivity graph
+    diff -- dict of the changes from the basic connectivity graph of previous_plan to basic_con_graph, like get_basic_graph_diff
+    allowed_channel_list -- list of the channels for calculate_ca
+    change_threshold -- share of changed edges and of nodes to plan again up to which the plan gets repaired
+    topology -- optional CompiledTopology of basic_con_graph, it gets compiled if it is not given
+    stats -- optional PlanningStats which gets the counters and the wall time of this run added
+    trace -- optional planner_trace.PlannerTrace which gets the decisions
+    returns a tuple with the tree and the channel assigned robust graph (like calculate_st and calculate_ca on calculate_survival_links)
+    """
+
+    if topology is None:
+        topology = compiled_topology.CompiledTopology(basic_con_graph)
+
+    affected_nodes = set(diff["added-nodes"]) | set(diff["removed-nodes"])
+    for kind in ("added-edges", "removed-edges", "changed-edges"):
+        for node_a, node_b in diff[kind]:
+            affected_nodes.add(node_a)
+            affected_nodes.add(node_b)
+    nr_changes = sum(len(diff[kind]) for kind in ("added-nodes", "removed-nodes", "added-edges", "removed-edges", "changed-edges"))
+
+    # The tree edges of the previous plan which are not touched by the changes
+    kept_graph = nx.Graph()
+    kept_edges = list()
+    for node_a, node_b in previous_plan.edges():
+        if previous_plan.edge[node_a][node_b].get("backup-link"):
+            continue
+        if node_a in affected_nodes or node_b in affected_nodes or not basic_con_graph.has_edge(node_a, node_b):
+            continue
+        kept_graph.add_edge(node_a, node_b)
+        kept_edges.append((node_a, node_b))
+    kept_nodes = max(nx.connected_components(kept_graph), key=len) if kept_edges else list()
+    kept_nodes = set(kept_nodes)
+    nr_repaired_nodes = topology.node_count - len(kept_nodes)
+
+    full = (not kept_nodes or nr_changes > change_threshold * topology.edge_count or
+            nr_repaired_nodes > change_threshold * topology.node_count)
+    logger.info("Replanning for " + str(nr_changes) + " changes, " + ("planning from scratch" if full else
+                "planning " + str(nr_repaired_nodes) + " of " + str(topology.node_count) + " nodes again"))
+    if trace is not None:
+        trace.emit("replan", changes=nr_changes, full=full, repaired=nr_repaired_nodes)
+    if stats is not None:
+        if full:
+            stats.counters["replan-full"] += 1
+        else:
+            stats.counters["replan-repaired-nodes"] += nr_repaired_nodes
+
+    if full:
+        mst_graph = calculate_st(basic_con_graph, topology=topology, stats=stats, trace=trace)
+        robust_graph = calculate_survival_links(mst_graph, basic_con_graph, topology=topology, stats=stats, trace=trace)
+        return mst_graph, calculate_ca(robust_graph, basic_con_graph, allowed_channel_list, topology=topology, stats=stats, trace=trace)
+
+    initial_tree = [(node_a, node_b) for node_a, node_b in kept_edges if node_a in kept_nodes]
+    mst_graph = calculate_st(basic_con_graph, topology=topology, start_node=initial_tree[0][0], stats=stats, trace=trace, initial_tree=initial_tree)
+    robust_graph = calculate_survival_links(mst_graph, basic_con_graph, topology=topology, stats=stats, trace=trace)
+
+    # Channel groups which did not change keep their channel
+    previous_groups = get_channel_groups_of_graph(previous_plan)
+    fixed_channels = dict()
+    for module, modules in get_channel_groups_of_graph(robust_graph).items():
+        if previous_groups.get(module) == modules and not affected_nodes.intersection(modules):
+            fixed_channels[module] = previous_plan.node[module].get("channel")
+    return mst_graph, calculate_ca(robust_graph, basic_con_graph, allowed_channel_list, topology=topology, stats=stats, trace=trace,
+                                   fixed_channels=fixed_channels)
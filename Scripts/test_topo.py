@@ -1,69 +1,87 @@
+import logging
 import networkx as nx
 import tcca
 import random
 import webbrowser
 import time
 max_weight = 1000
-g = nx.Graph()
-
-for i in range(9):
-    i = str(i)
-    g.add_node(i, isModule=False)
-    for j in range(2):
-        j = str(j)
-        module_name = i + "." + j
-        g.add_node(module_name, isModule=True)
-        g.add_edge(i, module_name)
-        g.edge[i][module_name]["snr"] = max_weight
-
-seen_links = {0: [0, 1, 3, 4],
-              1: [0, 1, 2, 3, 4, 5],
-              2: [1, 2, 4, 5],
-              3: [0, 1, 3, 4, 6, 7],
-              4: [0, 1, 2, 3, 4, 5, 6, 7, 8],
-              5: [1, 2, 4, 5, 7, 8],
-              6: [3, 4, 6, 7],
-              7: [3, 4, 5, 6, 7, 8],
-              8: [4, 5, 7, 8]}
-
-for node_a in seen_links:
-    for node_b in seen_links[node_a]:
-        for i in range(2):
-            i = str(i)
-            for j in range(2):
-                j = str(j)
-                node_a = str(node_a)
-                node_b = str(node_b)
-                moda = node_a + "." + i
-                modb = node_b + "." + j
-                if moda == modb:
+
+
+def create_topology(nr_aps, nr_modules=2, neighbor_distance=1, neighbor_density=1.0, seed=None):
+    """ Creates a random basic connectivity graph of APs on a grid
+
+    The APs are placed row by row on a square grid. All modules of APs which are at most neighbor_distance grid steps
+    away from each other (including the other modules of the same AP) can see each other with the probability
+    neighbor_density and get a random snr between 30 and 96.
+
+    Keyword arguments:
+    nr_aps -- number of APs (devices)
+    nr_modules -- number of modules (radios) per AP
+    neighbor_distance -- maximal distance in grid steps (horizontal, vertical and diagonal) of APs which see each other
+    neighbor_density -- probability that two modules of APs in distance see each other
+    seed -- seed for the random generator, the same seed gives the same topology
+    returns an undirected NetworkX graph which can be used by tcca
+    """
+
+    rnd = random.Random(seed)
+    columns = 1
+    while columns * columns < nr_aps:
+        columns += 1
+    g = nx.Graph()
+
+    for i in range(nr_aps):
+        i = str(i)
+        g.add_node(i, isModule=False)
+        for j in range(nr_modules):
+            j = str(j)
+            module_name = i + "." + j
+            g.add_node(module_name, isModule=True)
+            g.add_edge(i, module_name)
+            g.edge[i][module_name]["snr"] = max_weight
+
+    for ap_a in range(nr_aps):
+        row_a, column_a = divmod(ap_a, columns)
+        for row_b in range(row_a, row_a + neighbor_distance + 1):
+            for column_b in range(max(column_a - neighbor_distance, 0), min(column_a + neighbor_distance + 1, columns)):
+                ap_b = row_b * columns + column_b
+                # Every pair of APs only once
+                if ap_b >= nr_aps or ap_b < ap_a:
                     continue
-                g.add_edge(moda, modb, snr=random.randint(30, 96))
-
-tcca.write_json(g, "/home/kmanna/autowdsstatus/autowds-graph.json")
-time.sleep(2)
-webbrowser.open("file:///home/kmanna/autowdsstatus/autowds-graph.html")
-
-mst_graph = tcca.calculate_st(g)
-time.sleep(2)
-tcca.write_json(mst_graph, "/home/kmanna/autowdsstatus/autowds-graph.json")
-time.sleep(2)
-webbrowser.open("file:///home/kmanna/autowdsstatus/autowds-graph.html")
-
-robust_graph = tcca.calculate_survival_links(mst_graph, g)
-time.sleep(2)
-tcca.write_json(robust_graph, "/home/kmanna/autowdsstatus/autowds-graph.json")
-time.sleep(2)
-webbrowser.open("file:///home/kmanna/autowdsstatus/autowds-graph.html")
-
-ca_mst_graph = tcca.calculate_ca(mst_graph, g, [1,6,11])
-time.sleep(2)
-tcca.write_json(ca_mst_graph, "/home/kmanna/autowdsstatus/autowds-graph.json")
-time.sleep(2)
-webbrowser.open("file:///home/kmanna/autowdsstatus/autowds-graph.html")
-
-ca_robust_graph = tcca.calculate_ca(robust_graph, g, [1,6,11])
-time.sleep(2)
-tcca.write_json(ca_robust_graph, "/home/kmanna/autowdsstatus/autowds-graph.json")
-time.sleep(2)
-webbrowser.open("file:///home/kmanna/autowdsstatus/autowds-graph.html")
+                for i in range(nr_modules):
+                    for j in range(nr_modules):
+                        moda = str(ap_a) + "." + str(i)
+                        modb = str(ap_b) + "." + str(j)
+                        if moda == modb or g.has_edge(moda, modb):
+                            continue
+                        if rnd.random() < neighbor_density:
+                            g.add_edge(moda, modb, snr=rnd.randint(30, 96))
+    return g
+
+
+def show_graph(graph, json_file="/home/kmanna/autowdsstatus/autowds-graph.json"):
+    """ Writes the graph for AutoWDSstatus and opens it in the browser"""
+    tcca.write_json(graph, json_file)
+    time.sleep(2)
+    webbrowser.open("file://" + json_file[:-len(".json")] + ".html")
+    time.sleep(2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    stats = tcca.PlanningStats()
+    g = create_topology(9)
+    show_graph(g)
+
+    mst_graph = tcca.calculate_st(g, stats=stats)
+    show_graph(mst_graph)
+
+    robust_graph = tcca.calculate_survival_links(mst_graph, g, stats=stats)
+    show_graph(robust_graph)
+
+    ca_mst_graph = tcca.calculate_ca(mst_graph, g, [1,6,11], stats=stats)
+    show_graph(ca_mst_graph)
+
+    ca_robust_graph = tcca.calculate_ca(robust_graph, g, [1,6,11], stats=stats)
+    show_graph(ca_robust_graph)
+
+    print(stats)
@@ -1,5 +1,13 @@
+import atexit
 import os
 import logging
+import threading
+import time
+import hashlib
+import json
+import mmap
+import tempfile
+from multiprocessing.pool import ThreadPool
 
 import networkx as nx
 
@@ -7,7 +15,6 @@ import collections_enhanced
 import testcore.control.ssh
 
 __author__ = 'kmanna'
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger()
 
 def convert_to_undirected_graph(directed_graph, middle="lower"):
@@ -137,6 +144,16 @@ def graph_is_valid(graphname, lan_nodes, wlan_modules, assignable_channels):
     return valid
 
 
+def write_basic_graph(graph, filename):
+    """ Archives a basic connectivity graph (directed from get_basic_graph_from_wlc or undirected) with all its attributes"""
+    nx.write_gpickle(graph, filename)
+
+
+def read_basic_graph(filename):
+    """ Returns a basic connectivity graph archived by write_basic_graph"""
+    return nx.read_gpickle(filename)
+
+
 def get_modules_of_graph(graphname):
     """ For a given graph return a list of nodes where the "isModule" flag is true
     """
@@ -144,23 +161,394 @@ def get_modules_of_graph(graphname):
     return [node for (node, attributes) in graphname.nodes(data=True) if attributes["isModule"]]
 
 
-def translate_wlan_mac_to_interface_nr(module_wlan_mac):
-    """Translate a wlan mac to an interface Number """
-    for index in active_radios:
-        if active_radios[index]["wlan_mac"] == module_wlan_mac:
-            return active_radios[index]["ifc"]
-    logger.error("Could not translate interface_wlan_mac to interface_nr. You are asking for a wrong module")
-    exit(1)
+class RadioRegistry(object):
+    """ Index of the active radios (Active-Radios table) by their WLAN MAC, built once by build_basic_graph
+
+    Each radio is a dict like iter_active_radios generates, so the LAN MAC, the interface number, the device name
+    and the band of a module are dict lookups. The registry belongs to one basic graph and gets passed along with it
+    (e.g. to write_graph_to_wlc), so several plans can be made in one process.
+
+    Keyword arguments:
+    radios -- iterable of radio dicts
+    """
+
+    def __init__(self, radios=()):
+        self.radios = dict()
+        self.device_modules = dict()
+        for radio in radios:
+            self.add(radio)
+
+    def add(self, radio):
+        """ Adds a radio dict to the registry"""
+        self.radios[radio["wlan_mac"]] = radio
+        self.device_modules.setdefault(radio["lan_mac"], list()).append(radio["wlan_mac"])
+
+    def __contains__(self, wlan_mac):
+        return wlan_mac in self.radios
+
+    def __len__(self):
+        return len(self.radios)
+
+    def __iter__(self):
+        return iter(self.radios.values())
+
+    def get_radio(self, wlan_mac):
+        """ Returns the radio dict of the module with the WLAN MAC"""
+        if wlan_mac not in self.radios:
+            logger.error("Could not find the radio of " + str(wlan_mac) + ". You are asking for a wrong module")
+            exit(1)
+        return self.radios[wlan_mac]
+
+    def get_lan_mac(self, wlan_mac):
+        """ Returns the LAN MAC of the device of the module"""
+        return self.get_radio(wlan_mac)["lan_mac"]
+
+    def get_interface_nr(self, wlan_mac):
+        """ Returns the interface number of the module on its device (0 for WLAN-1)"""
+        return self.get_radio(wlan_mac)["ifc"]
+
+    def get_device_name(self, wlan_mac):
+        """ Returns the name of the device of the module"""
+        return self.get_radio(wlan_mac)["name"]
+
+    def get_band(self, wlan_mac):
+        """ Returns the radio band of the module"""
+        return self.get_radio(wlan_mac)["radio_band"]
+
+    def get_wlan_macs(self):
+        """ Returns the set of the WLAN MACs (the modules)"""
+        return set(self.radios)
+
+    def get_lan_macs(self):
+        """ Returns the set of the LAN MACs (the devices)"""
+        return set(self.device_modules)
+
+    def get_modules_of_device(self, lan_mac):
+        """ Returns the list of the WLAN MACs of the modules of the device"""
+        return self.device_modules.get(lan_mac, list())
+
+
+class SSHSessionPool(object):
+    """ Keeps authenticated SSH sessions (testcore.control.ssh.SSH) to the WLCs open and reuses them
+
+    Sessions are kept per (host, username, password). A session which was idle for longer than keepalive_interval
+    seconds gets probed with keepalive_command before it is used again, a dead one gets replaced by a new login.
+    The keepalive thread (started with the first login) probes the idle sessions, so the WLC does not drop them.
+    At most max_sessions sessions per WLC are in use at the same time, further callers wait for a free one.
+    counters holds the number of "logins", "reuses" and "reconnects".
+
+    Keyword arguments:
+    keepalive_interval -- seconds a session may be idle before it gets probed, None disables the keepalive thread
+    keepalive_command -- cheap LCOS command for the probes
+    max_sessions -- maximal number of open sessions per WLC
+    """
+
+    def __init__(self, keepalive_interval=60, keepalive_command="sysinfo", max_sessions=4):
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_command = keepalive_command
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.idle_sessions = dict()
+        self.slots = dict()
+        self.keepalive_thread = None
+        self.keepalive_stopped = threading.Event()
+        self.counters = collections_enhanced.Counter()
+
+    def get_slots(self, key):
+        """ Returns the semaphore which limits the sessions in use for the key"""
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.max_sessions)
+            return self.slots[key]
+
+    def open_session(self, key):
+        """ Logs in to the WLC of the key"""
+        host, username, password = key
+        logger.info("Opening SSH session to " + str(host))
+        session = testcore.control.ssh.SSH(host=host, username=username, password=password)
+        with self.lock:
+            self.counters["logins"] += 1
+            if self.keepalive_interval is not None and self.keepalive_thread is None:
+                self.keepalive_thread = threading.Thread(target=self.run_keepalive)
+                self.keepalive_thread.daemon = True
+                self.keepalive_thread.start()
+
+                # Stop the thread before the interpreter shuts down and takes the modules it uses away
+                atexit.register(self.stop_keepalive)
+        return session
+
+    def close_session(self, session):
+        """ Closes a session, if the session supports it"""
+        close = getattr(session, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def is_alive(self, session, host):
+        """ Returns True if the session to host still answers the keepalive command"""
+        try:
+            session.runquery(self.keepalive_command)
+            return True
+        except Exception as error:
+            # A keepalive command the WLC does not accept would otherwise just cost a new login per use
+            logger.warning("Keepalive '" + self.keepalive_command + "' failed on SSH session to " + str(host) +
+                           ": " + repr(error))
+            return False
+
+    def acquire(self, host, username, password):
+        """ Returns an open session to the WLC, an idle one if there is one, it has to be given back with release"""
+        key = (host, username, password)
+        self.get_slots(key).acquire()
+        while True:
+            with self.lock:
+                if not self.idle_sessions.get(key):
+                    break
+                session, last_used = self.idle_sessions[key].pop()
+            if self.keepalive_interval is None or time.time() - last_used < self.keepalive_interval or self.is_alive(session, host):
+                with self.lock:
+                    self.counters["reuses"] += 1
+                return session
+            logger.info("Dropping dead SSH session to " + str(host))
+            self.close_session(session)
+        try:
+            return self.open_session(key)
+        except Exception:
+            self.get_slots(key).release()
+            raise
+
+    def release(self, host, username, password, session, broken=False):
+        """ Gives a session from acquire back, a broken one gets closed instead of reused"""
+        key = (host, username, password)
+        if broken:
+            self.close_session(session)
+        else:
+            with self.lock:
+                self.idle_sessions.setdefault(key, list()).append((session, time.time()))
+        self.get_slots(key).release()
+
+    def run(self, host, username, password, method, args=(), retry=True):
+        """ Calls a method of a pooled session to the WLC, e.g. run(host, username, password, "runquery_table", (tablename,))
+
+        Keyword arguments:
+        method -- name of the method of testcore.control.ssh.SSH
+        args -- tuple with the arguments for the method
+        retry -- if the call fails, repeat it once on a new session (only for calls which can be repeated, like queries)
+        returns the result of the method
+        """
+        session = self.acquire(host, username, password)
+        try:
+            result = getattr(session, method)(*args)
+        except Exception:
+            self.release(host, username, password, session, broken=True)
+            if not retry:
+                raise
+            logger.warning("SSH session to " + str(host) + " failed, reconnecting")
+            with self.lock:
+                self.counters["reconnects"] += 1
+            session = self.acquire(host, username, password)
+            try:
+                result = getattr(session, method)(*args)
+            except Exception:
+                self.release(host, username, password, session, broken=True)
+                raise
+        self.release(host, username, password, session)
+        return result
+
+    def keepalive(self):
+        """ Probes the sessions which are idle for longer than keepalive_interval and drops the dead ones"""
+        now = time.time()
+        probes = list()
+        with self.lock:
+            for key in self.idle_sessions:
+                for session, last_used in self.idle_sessions[key]:
+                    if now - last_used >= self.keepalive_interval:
+                        probes.append((key, session))
+                self.idle_sessions[key] = [(session, last_used) for session, last_used in self.idle_sessions[key]
+                                           if now - last_used < self.keepalive_interval]
+        for key, session in probes:
+            if self.is_alive(session, key[0]):
+                with self.lock:
+                    self.idle_sessions[key].append((session, time.time()))
+            else:
+                logger.info("Dropping dead SSH session to " + str(key[0]))
+                self.close_session(session)
+
+    def run_keepalive(self):
+        """ Body of the keepalive thread"""
+        while not self.keepalive_stopped.wait(self.keepalive_interval / 2.0):
+            self.keepalive()
+
+    def stop_keepalive(self):
+        """ Stops the keepalive thread"""
+        self.keepalive_stopped.set()
+        if self.keepalive_thread is not None:
+            self.keepalive_thread.join()
+
+    def close_all(self):
+        """ Closes all idle sessions"""
+        with self.lock:
+            sessions = [session for key in self.idle_sessions for session, last_used in self.idle_sessions[key]]
+            self.idle_sessions = dict()
+        for session in sessions:
+            self.close_session(session)
+
+
+# The sessions of get_table_data and run_script_on_wlc
+session_pool = SSHSessionPool()
 
 
 def get_table_data(tablename, hostname, username, password):
     """Returns a list of lists with tabledata from wlc for a given tablename, else empty table """
-    connection = testcore.control.ssh.SSH(host=hostname, username=username, password=password)
-    return connection.runquery_table(tablename)
+    return session_pool.run(hostname, username, password, "runquery_table", (tablename,))
+
+
+def get_tables_data(tablenames, hostname, username, password, max_parallel=None, timings=None):
+    """ Reads several tables from the wlc at the same time, so the whole read takes about as long as the slowest table
+
+    Keyword arguments:
+    tablenames -- list of tablenames
+    max_parallel -- maximal number of tables read at the same time, default is the maximal number of sessions per WLC
+                    of the session_pool (which is also the upper bound)
+    timings -- optional dict which gets the seconds of each table
+    returns a list with the tabledata (like get_table_data) of each table in the order of tablenames
+    """
+
+    def get_timed_table_data(tablename):
+        start_time = time.time()
+        table = get_table_data(tablename, hostname, username, password)
+        return table, time.time() - start_time
+
+    if max_parallel is None:
+        max_parallel = session_pool.max_sessions
+    max_parallel = min(max_parallel, len(tablenames))
+    if max_parallel <= 1:
+        results = [get_timed_table_data(tablename) for tablename in tablenames]
+    else:
+        pool = ThreadPool(max_parallel)
+        try:
+            results = pool.map(get_timed_table_data, tablenames)
+        finally:
+            pool.close()
+            pool.join()
+
+    for tablename, (table, seconds) in zip(tablenames, results):
+        logger.info("Read " + str(len(table)) + " rows of " + tablename + " in " + str(round(seconds, 3)) + "s")
+        if timings is not None:
+            timings[tablename] = seconds
+    return [table for table, seconds in results]
+
+
+# Snapshot files (see write_snapshot) start with this line
+snapshot_magic = "AWDSNAP2\n"
+
+# Snapshots of the first format, where each table is one JSON list, can still be read
+snapshot_magic_v1 = "AWDSNAP1\n"
+
+
+def write_snapshot(tables, directory=".", prefix="autowds"):
+    """ Writes the raw rows of WLC tables to a content-hashed snapshot file
+
+    The file has the magic line, a JSON header line with the sha256 of the payload and the offset and length of each
+    table in the payload, and the payload, which are the tables one after the other (in sorted order) with each row
+    as compact JSON on a line of its own, so the rows can be read one by one.
+    The name of the file contains the beginning of the hash, so capturing the same tables again gives the same file.
+
+    Keyword arguments:
+    tables -- dict which maps tablenames to their tabledata (list of lists, like get_table_data)
+    directory -- directory to write the snapshot to
+    prefix -- start of the filename
+    returns the filename of the snapshot
+    """
+    index = dict()
+    parts = list()
+    offset = 0
+    for tablename in sorted(tables):
+        part = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in tables[tablename])
+        index[tablename] = [offset, len(part)]
+        offset += len(part)
+        parts.append(part)
+    payload = "".join(parts)
+    digest = hashlib.sha256(payload).hexdigest()
+
+    filename = os.path.join(directory, prefix + "-" + digest[:16] + ".snap")
+    if not os.path.exists(filename):
+        # Write to a temporary file first, so a snapshot file is always complete
+        temp_fd, temp_filename = tempfile.mkstemp(dir=directory, prefix=prefix + "-", suffix=".tmp")
+        with os.fdopen(temp_fd, "wb") as outfile:
+            outfile.write(snapshot_magic)
+            outfile.write(json.dumps({"sha256": digest, "tables": index}, sort_keys=True) + "\n")
+            outfile.write(payload)
+        os.rename(temp_filename, filename)
+    return filename
+
+
+class TableSnapshot(object):
+    """ Read access to a snapshot file of write_snapshot
+
+    The file gets memory mapped, a table only gets parsed when it is read, iter_table_data parses it row by row.
+    Snapshots of the first format (AWDSNAP1) are read too, but their tables get parsed as a whole.
+
+    Keyword arguments:
+    filename -- snapshot file
+    verify -- if True the sha256 of the payload gets checked
+    """
+
+    def __init__(self, filename, verify=True):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(snapshot_magic)] == snapshot_magic:
+            self.rows_per_line = True
+        elif self.map[:len(snapshot_magic_v1)] == snapshot_magic_v1:
+            self.rows_per_line = False
+        else:
+            logger.error(filename + " is not a snapshot file")
+            exit(1)
+        header_end = self.map.find("\n", len(snapshot_magic))
+        header = json.loads(self.map[len(snapshot_magic):header_end])
+        self.sha256 = header["sha256"]
+        self.tables = header["tables"]
+        self.payload_start = header_end + 1
+        if verify and hashlib.sha256(self.map[self.payload_start:]).hexdigest() != self.sha256:
+            logger.error("Snapshot " + filename + " is damaged, its content does not match its hash")
+            exit(1)
+
+    def iter_table_data(self, tablename):
+        """ Generates the rows of the table"""
+        offset, length = self.tables[tablename]
+        position = self.payload_start + offset
+        end = position + length
+        if not self.rows_per_line:
+            for row in json.loads(self.map[position:end]):
+                yield row
+            return
+        while position < end:
+            line_end = self.map.find("\n", position, end)
+            yield json.loads(self.map[position:line_end])
+            position = line_end + 1
+
+    def get_table_data(self, tablename):
+        """ Returns the tabledata of the table like get_table_data"""
+        return list(self.iter_table_data(tablename))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
 
 
-def get_basic_graph_from_wlc(hostname, username, password, assignable_channels):
-    """Get data from the WLC and return a networkx basic connectivity graph"""
+intra_wlan_discovery_tablename = "/Status/WLAN-Management/Intra-WLAN-Discovery"
+active_radios_tablename = "/Status/WLAN-Management/AP-Status/Active-Radios"
+
+
+def get_basic_graph_from_wlc(hostname, username, password, assignable_channels, timings=None, snapshot_directory=None):
+    """Get data from the WLC and return a networkx basic connectivity graph
+
+    timings -- optional dict which gets the seconds of each table read
+    snapshot_directory -- optional directory, which gets a snapshot of the read tables (see write_snapshot),
+                          so the graph can be built again later with get_basic_graph_from_snapshot
+    """
     logger.info("Getting Data from WLC...")
 
     # First check if we get a connection to the wlc
@@ -168,111 +556,89 @@ def get_basic_graph_from_wlc(hostname, username, password, assignable_channels):
         print(hostname + " is down!")
         exit(1)
 
-    # Create the dict of dicts for scan results
-    # Example entry: scan_results[<index>][<name>]["lan_mac"] = <value>
-    #                scan_results[<index>][<name>]["channel"] = <value>
-    #                ...
-    intra_wlan_discovery = dict()
-    intra_wlan_discovery_index = 0
-    for line in get_table_data("/Status/WLAN-Management/Intra-WLAN-Discovery", hostname, username, password):
-        entry_dict = dict()
-        entry_dict["source_mac"] = line[0]
-        entry_dict["wlan_dest_mac"] = line[1]
-        entry_dict["channel"] = line[2]
-        entry_dict["signal_strength"] = line[3]
-        entry_dict["noise_level"] = line[4]
-        entry_dict["age"] = line[5]
-        intra_wlan_discovery[intra_wlan_discovery_index] = entry_dict
-        intra_wlan_discovery_index += 1
+    # Both tables are read at the same time
+    intra_wlan_discovery_table, active_radios_table = get_tables_data([intra_wlan_discovery_tablename, active_radios_tablename],
+                                                                      hostname, username, password, timings=timings)
+    if snapshot_directory is not None:
+        snapshot = write_snapshot({intra_wlan_discovery_tablename: intra_wlan_discovery_table, active_radios_tablename: active_radios_table},
+                                  snapshot_directory)
+        logger.info("Wrote snapshot " + snapshot)
 
-    # First create the interfaces-graph
-    # That means we create a node for each WLAN-interface of a node
-    # and connect each of those of a node with a link with quality 0(best)(so the MST takes this edge always)
-    # Therefore we use the Status/WLAN-Management/AP-Status/Active-Radios/ Table of the WLC
-    # This gives us the interfaces of each node (identified by the MACs (LAN/WLAN)
-    # Create the dict of dicts for active radios
-    # Example entry: active_radios[<index>][<name>]["lan_mac"] = <value>
-    #                active_radios[<index>][<name>]["bssid_mac"] = <value>
-    #                ...
-    active_wlan_interfaces = set()
-    global active_radios
-    active_radios = dict()
-    active_radios_index = 0
-    for line in get_table_data("/Status/WLAN-Management/AP-Status/Active-Radios", hostname, username, password):
-        entry_dict = dict()
-        entry_dict["lan_mac"] = line[0]
-        entry_dict["ifc"] = line[1]
-        entry_dict["ip"] = line[2]
-        entry_dict["name"] = line[3]
+    return build_basic_graph(intra_wlan_discovery_table, active_radios_table, assignable_channels)
+
+
+def get_basic_graph_from_snapshot(filename, assignable_channels):
+    """ Builds the basic connectivity graph from a snapshot of get_basic_graph_from_wlc instead of the WLC (no SSH)"""
+    logger.info("Getting Data from snapshot " + filename + "...")
+    snapshot = TableSnapshot(filename)
+    try:
+        return build_basic_graph(snapshot.iter_table_data(intra_wlan_discovery_tablename), snapshot.iter_table_data(active_radios_tablename),
+                                 assignable_channels)
+    finally:
+        snapshot.close()
+
+
+def iter_active_radios(active_radios_table):
+    """ Generates a dict with the columns the planner uses for each row of the Active-Radios table
+
+    Example: {"lan_mac": <value>, "ifc": <value>, "name": <value>, "wlan_mac": <value>, "radio_band": <value>}
+    """
+    for line in active_radios_table:
         if not line[3]:
             logger.error("Name for AP: " + str(line[0]) + " not set!")
             exit(1)
-        entry_dict["location"] = line[4]
-        entry_dict["wlan_mac"] = line[5]
-        entry_dict["radio_band"] = line[6]
-        entry_dict["channel"] = line[7]
-        entry_dict["modem_load_min"] = line[8]
-        entry_dict["modem_load_max"] = line[9]
-        entry_dict["modem_load_avg"] = line[10]
-        entry_dict["client_count"] = line[11]
-        entry_dict["background_scan"] = line[12]
-        entry_dict["card_id"] = line[13]
-        entry_dict["fw_version"] = line[14]
-        entry_dict["card_serial_nr"] = line[15]
-        entry_dict["operating"] = line[16]
-        entry_dict["transmit_power"] = line[17]
-        entry_dict["eirp"] = line[18]
-        entry_dict["exc_eirp"] = line[19]
-        entry_dict["internal"] = line[20]
-        entry_dict["nr_radios"] = line[21]
-        entry_dict["module"] = line[22]
-        entry_dict["serial_nr"] = line[23]
-        entry_dict["version"] = line[24]
-        entry_dict["card_state"] = line[25]
-        entry_dict["field_optimization"] = line[26]
-        entry_dict["ap-connections"] = line[27]
-        entry_dict["groups"] = line[28]
-        active_wlan_interfaces.add(line[5])
-        active_radios[active_radios_index] = entry_dict
-        active_radios_index += 1
+        yield {"lan_mac": line[0], "ifc": line[1], "name": line[3], "wlan_mac": line[5], "radio_band": line[6]}
 
-    # Todo: Foreign table/ Seen-channels, but christoph has to implement this table first (probably wont happen anytime soon)
-    # Separate our connections from foreigners
-    #our_connections = dict()
-    #foreign_connections = dict()
-    #for index in scan_results.keys():
-    #    if scan_results[index]["seen_bssid"] in active_radios_ap_bssid_mac:
-    #        our_connections[index] = scan_results[index]
-    #    else:
-    #        foreign_connections[index] = scan_results[index]
 
-    # Safety check
-    if len(intra_wlan_discovery) == 0:
-        logger.error("Our connection list is empty. The APs don't see each other")
-        exit(1)
+def iter_intra_wlan_links(intra_wlan_discovery_table, active_wlan_interfaces, row_counter=None):
+    """ Generates (source_mac, wlan_dest_mac, snr) for each row of the Intra-WLAN-Discovery table
 
-    # Todo: Foreign table/ Seen-channels, but christoph has to implement this table first (probably wont happen anytime soon)
-    #if len(foreign_connections) == 0:
-    #    logger.warning("Foreign connection list is empty. The APs don't show foreign networks.")
-    #    logger.warning("         This is unlikely, except there are really no other wireless lan networks around")
-
-    # Remove the inactive connections from scan results
-    # Only consider those connections, which have a corresponding partner in the active radios table, since only those connections are really active
-    for index in intra_wlan_discovery.keys():
-        if not intra_wlan_discovery[index]["source_mac"] in active_wlan_interfaces or not intra_wlan_discovery[index]["wlan_dest_mac"] in active_wlan_interfaces:
-            logger.info("Ignoring link {0},{1}, since at least one is not in active Radios.".format(str(intra_wlan_discovery[index]["source_mac"]),
-                                                                                                    str(intra_wlan_discovery[index]["wlan_dest_mac"])))
-            del intra_wlan_discovery[index]
+    Only consider those connections, which have a corresponding partner in the active radios table, since only those connections are really active
+
+    Keyword arguments:
+    active_wlan_interfaces -- set of the WLAN MACs of the active radios
+    row_counter -- optional collections_enhanced.Counter which gets the number of "rows" read
+    """
+    log_ignored = logger.isEnabledFor(logging.INFO)
+    for line in intra_wlan_discovery_table:
+        if row_counter is not None:
+            row_counter["rows"] += 1
+        source_mac = line[0]
+        wlan_dest_mac = line[1]
+        if source_mac not in active_wlan_interfaces or wlan_dest_mac not in active_wlan_interfaces:
+            if log_ignored:
+                logger.info("Ignoring link {0},{1}, since at least one is not in active Radios.".format(str(source_mac), str(wlan_dest_mac)))
+            continue
+
+        # The following is done, since Alfred Arnold mentioned that the Signal-strength value in LCOS is already the SNR
+        yield source_mac, wlan_dest_mac, int(line[3])
+
+
+def build_basic_graph(intra_wlan_discovery_table, active_radios_table, assignable_channels):
+    """ Builds the basic connectivity graph from the rows of the Intra-WLAN-Discovery and the Active-Radios table
+
+    The tables can be any iterables of rows (e.g. generators), the rows of the Intra-WLAN-Discovery table are turned
+    into edges one by one, without keeping the table.
+
+    returns the directed NetworkX basic connectivity graph, the set of the modules (WLAN MACs), the set of the devices (LAN MACs)
+            and the RadioRegistry of the active radios
+    """
+
+    # First create the interfaces-graph
+    # That means we create a node for each WLAN-interface of a node
+    # and connect each of those of a node with a link with quality 0(best)(so the MST takes this edge always)
+    # Therefore we use the Status/WLAN-Management/AP-Status/Active-Radios/ Table of the WLC
+    # This gives us the interfaces of each node (identified by the MACs (LAN/WLAN)
+    radio_registry = RadioRegistry(iter_active_radios(active_radios_table))
 
     # Create set of nodes, which are modules
-    wlan_modules = set()
-    for index in active_radios.keys():
-        wlan_modules.add(active_radios[index]["wlan_mac"])
+    wlan_modules = radio_registry.get_wlan_macs()
 
     # Create set of nodes, which are not modules (=>actual devices)
-    lan_nodes = set()
-    for index in active_radios.keys():
-        lan_nodes.add(active_radios[index]["lan_mac"])
+    lan_nodes = radio_registry.get_lan_macs()
+
+    # Todo: Foreign table/ Seen-channels, but christoph has to implement this table first (probably wont happen anytime soon)
+    # Separate our connections from foreigners
 
     basic_graph = nx.DiGraph()
 
@@ -312,10 +678,9 @@ def get_basic_graph_from_wlc(hostname, username, password, assignable_channels):
         basic_graph.node[module]["modules"] = 1
 
     # Fill/Add node-module edges with data from wlc
-    for index in active_radios.keys():
-        lan_mac = active_radios[index]["lan_mac"]
-        name = active_radios[index]["name"]
-        wlan_mac = active_radios[index]["wlan_mac"]
+    for radio in radio_registry:
+        lan_mac = radio["lan_mac"]
+        wlan_mac = radio["wlan_mac"]
 
         # Add the edge
         basic_graph.add_edge(lan_mac, wlan_mac)
@@ -325,33 +690,23 @@ def get_basic_graph_from_wlc(hostname, username, password, assignable_channels):
 
         # Write all data also into graph
         basic_graph.node[wlan_mac]["module-of"] = lan_mac
-        basic_graph.node[wlan_mac]["module-of-name"] = name
-        for key in active_radios[index].keys():
-            basic_graph.edge[lan_mac][wlan_mac][key] = active_radios[index][key]
+        basic_graph.node[wlan_mac]["module-of-name"] = radio["name"]
+        basic_graph.edge[lan_mac][wlan_mac].update(radio)
 
         # Also count here the number of modules each node has
         basic_graph.node[lan_mac]["modules"] += 1
 
-    # Add all possible module-module links
-    for index in intra_wlan_discovery.keys():
-        source_mac = intra_wlan_discovery[index]["source_mac"]
-        wlan_dest_mac = intra_wlan_discovery[index]["wlan_dest_mac"]
-        #channel = autowds_topology_scan_results[index]["channel"]
-        signal_strength = int(intra_wlan_discovery[index]["signal_strength"])
-        #noise_level = int(autowds_topology_scan_results[index]["noise_level"])
-        #age = autowds_topology_scan_results[index]["age"]
-
-        basic_graph.add_edge(source_mac, wlan_dest_mac)
-
-        # Set the score of this edge
-        # The following is done, since Alfred Arnold mentioned that the Signal-strength value in LCOS is already the SNR
-        snr = signal_strength
-        basic_graph.edge[source_mac][wlan_dest_mac]["snr"] = snr
-
-        # Initialize each edge with empty channel
-        basic_graph.edge[source_mac][wlan_dest_mac]["channel"] = None
+    # Add all possible module-module links, straight from the rows of the table
+    row_counter = collections_enhanced.Counter()
+    for source_mac, wlan_dest_mac, snr in iter_intra_wlan_links(intra_wlan_discovery_table, wlan_modules, row_counter):
+        basic_graph.add_edge(source_mac, wlan_dest_mac, snr=snr, channel=None)
         basic_graph.edge[source_mac][wlan_dest_mac]["real-connection"] = True
 
+    # Safety check
+    if row_counter["rows"] == 0:
+        logger.error("Our connection list is empty. The APs don't see each other")
+        exit(1)
+
     # Todo: Foreign table/ Seen-channels, but christoph has to implement this table first (probably wont happen anytime soon)
     # Fill interference list
     #for index in foreign_connections.keys():
@@ -362,11 +717,14 @@ def get_basic_graph_from_wlc(hostname, username, password, assignable_channels):
     #    if channel in assignable_channels:
     #        basic_graph.node[wlan_mac]["seen_channels"][channel] += 1
 
-    return basic_graph, wlan_modules, lan_nodes
+    return basic_graph, wlan_modules, lan_nodes, radio_registry
 
 
-def write_graph_to_wlc(wlan_modules, address, username, password, pmst_graph_with_channels_assigned, continuation_time):
-    """ Write the given NetworkX graph back to the WLC, so it can reconfigure the Accesspoints"""
+def write_graph_to_wlc(wlan_modules, address, username, password, pmst_graph_with_channels_assigned, continuation_time, radio_registry):
+    """ Write the given NetworkX graph back to the WLC, so it can reconfigure the Accesspoints
+
+    radio_registry -- RadioRegistry of the basic graph (from get_basic_graph_from_wlc)
+    """
     logger.info("Writing Data to WLC")
     lcos_script = list()
 
@@ -385,21 +743,7 @@ def write_graph_to_wlc(wlan_modules, address, username, password, pmst_graph_wit
         if not a in wlan_modules or not b in wlan_modules:
             continue
 
-        module_a = str(a)
-        module_b = str(b)
-        module_a_device = str(pmst_graph_with_channels_assigned.node[module_a]["module-of-name"])
-        module_b_device = str(pmst_graph_with_channels_assigned.node[module_b]["module-of-name"])
-        module_a_interface_nr = int(translate_wlan_mac_to_interface_nr(module_a)) + 1
-        module_b_interface_nr = int(translate_wlan_mac_to_interface_nr(module_b)) + 1
-        module_a_interface_name = "WLAN-" + str(module_a_interface_nr)
-        module_b_interface_name = "WLAN-" + str(module_b_interface_nr)
-
-        # Form: AUTOWDS_PROFILE 0 AP1 IFC1 AP2 IFC2
-        #if not wlc_connection.runscript(['set /Setup/WLAN-Management/AP-Configuration/AutoWDS-Topology/AUTOWDS_PROFILE 0 ' + module_a_device + ' ' + module_a + ' ' + module_b_device + ' '+module_b]):
-        #    logger.error("Could not write a link to table")
-        #    exit(1)
-        lcos_script.append('add /Setup/WLAN-Management/AP-Configuration/AutoWDS-Topology/AUTOWDS_PROFILE {0} {1} {2} {3} {4} "12345678" 1 * * * {5}'
-                           .format(prio_counter, module_a_device, module_a_interface_name, module_b_device, module_b_interface_name, continuation_time))
+        lcos_script.append(get_link_script_line(radio_registry, a, b, prio_counter, continuation_time))
         prio_counter += 1
 
     # Assign channels to the modules
@@ -421,28 +765,81 @@ def write_graph_to_wlc(wlan_modules, address, username, password, pmst_graph_wit
         if module_channel_assignment[element] is None:
             continue
 
-        module_number = int(translate_wlan_mac_to_interface_nr(module_name)) + 1
-        module_number_name = "WLAN-Module-" + str(module_number)
-        module_channel_list_name = "Module-" + str(module_number) + "-Channel-List"
-        # Set the band
-        # Excerpt from LCOS : :default (0), 2.4GHz (1), 5GHz (2), Off (3), Auto (255)
-        if int(module_channel_assignment[element]) <= 14:  # set to 2,4GHz
-            band = "1"
-        else:  # set to 5GHz
-            band = "2"
-        corresponding_device_name = pmst_graph_with_channels_assigned.node[module_name]["module-of"]
-
-        lcos_script.append('set /Setup/WLAN-Management/AP-Configuration/Accesspoints/{0} {{{1}}} {2} {{{3}}} {4}'
-                           .format(corresponding_device_name, module_number_name, band, module_channel_list_name, channel))
+        lcos_script.append(get_channel_script_line(radio_registry, module_name, channel))
 
     # Really write it now
+    run_script_on_wlc(address, username, password, lcos_script)
+
+
+def get_link_script_line(radio_registry, module_a, module_b, prio, continuation_time):
+    """ Returns the LCOS script line which adds the link between module_a and module_b to the AutoWDS topology of the WLC"""
+    module_a = str(module_a)
+    module_b = str(module_b)
+    module_a_device = str(radio_registry.get_device_name(module_a))
+    module_b_device = str(radio_registry.get_device_name(module_b))
+    module_a_interface_nr = int(radio_registry.get_interface_nr(module_a)) + 1
+    module_b_interface_nr = int(radio_registry.get_interface_nr(module_b)) + 1
+    module_a_interface_name = "WLAN-" + str(module_a_interface_nr)
+    module_b_interface_name = "WLAN-" + str(module_b_interface_nr)
+
+    # Form: AUTOWDS_PROFILE 0 AP1 IFC1 AP2 IFC2
+    return ('add /Setup/WLAN-Management/AP-Configuration/AutoWDS-Topology/AUTOWDS_PROFILE {0} {1} {2} {3} {4} "12345678" 1 * * * {5}'
+            .format(prio, module_a_device, module_a_interface_name, module_b_device, module_b_interface_name, continuation_time))
+
+
+def get_channel_script_line(radio_registry, module, channel):
+    """ Returns the LCOS script line which sets the band and channel of module on the WLC"""
+    module_name = str(module)
+    channel = str(channel)
+    module_number = int(radio_registry.get_interface_nr(module_name)) + 1
+    module_number_name = "WLAN-Module-" + str(module_number)
+    module_channel_list_name = "Module-" + str(module_number) + "-Channel-List"
+    # Set the band
+    # Excerpt from LCOS : :default (0), 2.4GHz (1), 5GHz (2), Off (3), Auto (255)
+    if int(channel) <= 14:  # set to 2,4GHz
+        band = "1"
+    else:  # set to 5GHz
+        band = "2"
+    corresponding_device_name = radio_registry.get_lan_mac(module_name)
+
+    return ('set /Setup/WLAN-Management/AP-Configuration/Accesspoints/{0} {{{1}}} {2} {{{3}}} {4}'
+            .format(corresponding_device_name, module_number_name, band, module_channel_list_name, channel))
+
+
+def write_failover_to_wlc(address, username, password, radio_registry, failover_entry, prio, continuation_time, confirm=True):
+    """ Activate the backup link of a failover table entry (see tcca.calculate_failover_table) on the WLC
+
+    Only the backup link gets added and the channels of the entry get set, the rest of the configuration stays
+
+    Keyword arguments:
+    radio_registry -- RadioRegistry of the basic graph (like the one given to write_graph_to_wlc)
+    failover_entry -- entry of the failover table for the failed link
+    prio -- priority of the new row in the AutoWDS topology, it has to be unused
+    confirm -- if False the script gets written without asking, for automatic recovery
+    """
+    if failover_entry is None or failover_entry["backup"] is None:
+        logger.error("There is no backup link for this link")
+        return
+    logger.info("Writing failover to WLC")
+    module_a, module_b = failover_entry["backup"]
+    lcos_script = [get_link_script_line(radio_registry, module_a, module_b, prio, continuation_time)]
+    for module in sorted(failover_entry["channels"]):
+        lcos_script.append(get_channel_script_line(radio_registry, module, failover_entry["channels"][module]))
+    run_script_on_wlc(address, username, password, lcos_script, confirm)
+
+
+def run_script_on_wlc(address, username, password, lcos_script, confirm=True):
+    """ Runs the LCOS script on the WLC, after asking for confirmation if confirm is True"""
     for line in lcos_script:
         logger.debug(line)
-    answer = raw_input("Really write this to the WLC? [yN]:")
+    if confirm:
+        answer = raw_input("Really write this to the WLC? [yN]:")
+    else:
+        answer = "y"
     if answer and len(answer) > 0:
         if answer[0] == "y" or answer[0] == "Y":
-            wlc_connection = testcore.control.ssh.SSH(host=address, username=username, password=password)
-            wlc_connection.runscript(lcos_script)
+            # A script which failed halfway must not run again, so no retry
+            session_pool.run(address, username, password, "runscript", (lcos_script,), retry=False)
             print("Successfully written data to WLC")
             return
     print("Nothing written to WLC")